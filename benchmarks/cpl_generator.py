@@ -0,0 +1,181 @@
+""" ProgramGenerator - writes random, valid CPL programs for the benchmarks
+    a generator is seeded, so the same settings always give the same program.
+        declarations - number of declared variables (about a quarter of them are float)
+        depth        - how deep while, switch and if statements nest
+        bool_size    - number of relational tests in every boolean expression
+    a program is sized by its statement count or by its line count.
+    the programs are meant to be compiled, not run, while loops count a loop variable down
+    but the values of the other variables are not kept in any range
+"""
+import argparse
+import random
+import sys
+
+RELOPS = ('==', '!=', '<', '>', '<=', '>=')
+
+# names declared on one declaration line
+NAMES_PER_LINE = 8
+
+
+class ProgramGenerator:
+    def __init__(self, seed=0, declarations=16, depth=3, bool_size=2):
+        self.random = random.Random(seed)
+        self.depth = max(0, depth)
+        self.bool_size = max(1, bool_size)
+        count = max(2, declarations)
+        floats = max(1, count // 4)
+        self.ints = [f"i{index}" for index in range(count - floats)]
+        self.floats = [f"f{index}" for index in range(floats)]
+        # one loop variable per nesting level, loops on the same level reuse it
+        self.counters = [f"w{level}" for level in range(self.depth + 1)]
+        self.lines = []
+
+    def program(self, statements=None, lines=None):
+        """ returns the source of a program with the given number of top level statements,
+            or with about the given number of lines """
+        self.lines = []
+        for names, kind in ((self.ints + self.counters, 'int'), (self.floats, 'float')):
+            for start in range(0, len(names), NAMES_PER_LINE):
+                self.lines.append(f"{', '.join(names[start:start + NAMES_PER_LINE])} : {kind};")
+        self.lines.append("{")
+        # the variables start out with input values, so the optimizer can't fold the program away
+        for name in self.ints + self.floats:
+            self.lines.append(f"    input({name});")
+
+        if statements is None and lines is None:
+            statements = 100
+        count = 0
+        while (statements is None or count < statements) and (lines is None or len(self.lines) < lines - 1):
+            self.statement(0, 1)
+            count += 1
+        self.lines.append("}")
+        return "\n".join(self.lines) + "\n"
+
+    def emit(self, indent, text):
+        self.lines.append("    " * indent + text)
+
+    def statement(self, level, indent):
+        roll = self.random.random()
+        if level < self.depth and roll < 0.1:
+            self.while_statement(level, indent)
+        elif level < self.depth and roll < 0.2:
+            self.switch_statement(level, indent)
+        elif level < self.depth and roll < 0.32:
+            self.if_statement(level, indent)
+        elif roll < 0.45:
+            self.output(indent)
+        else:
+            self.assignment(indent)
+
+    def statements(self, level, indent, count):
+        for _ in range(count):
+            self.statement(level, indent)
+
+    def output(self, indent):
+        """ output takes a variable or a literal, the compiler doesn't declare the temps of an expression """
+        roll = self.random.random()
+        if roll < 0.2:
+            self.emit(indent, f"output({self.random.randint(0, 99)});")
+        else:
+            self.emit(indent, f"output({self.random.choice(self.floats if roll < 0.4 else self.ints)});")
+
+    def assignment(self, indent):
+        real = self.random.random() < 0.25
+        name = self.random.choice(self.floats if real else self.ints)
+        self.emit(indent, f"{name} = {self.expression(real)};")
+
+    def while_statement(self, level, indent):
+        counter = self.counters[level]
+        self.emit(indent, f"{counter} = {self.random.randint(1, 4)};")
+        self.emit(indent, f"while ({counter} > 0 && {self.conjunction(self.bool_size)})")
+        self.emit(indent, "{")
+        self.statements(level + 1, indent + 1, self.random.randint(1, 4))
+        self.emit(indent + 1, f"{counter} = {counter} - 1;")
+        self.emit(indent, "}")
+
+    def switch_statement(self, level, indent):
+        self.emit(indent, f"switch ({self.random.choice(self.ints)} + {self.random.randint(0, 9)})")
+        self.emit(indent, "{")
+        cases = self.random.sample(range(20), self.random.randint(1, 10))
+        for value in cases:
+            self.emit(indent + 1, f"case {value}:")
+            self.statements(level + 1, indent + 2, self.random.randint(1, 3))
+            self.emit(indent + 2, "break;")
+        self.emit(indent + 1, "default:")
+        self.statements(level + 1, indent + 2, self.random.randint(1, 2))
+        self.emit(indent + 2, "break;")
+        self.emit(indent, "}")
+
+    def if_statement(self, level, indent):
+        self.emit(indent, f"if ({self.boolean(self.bool_size)})")
+        self.emit(indent, "{")
+        self.statements(level + 1, indent + 1, self.random.randint(1, 4))
+        self.emit(indent, "}")
+        self.emit(indent, "else")
+        self.emit(indent, "{")
+        self.statements(level + 1, indent + 1, self.random.randint(1, 4))
+        self.emit(indent, "}")
+
+    def boolean(self, size):
+        """ a boolean expression with size relational tests """
+        if size == 1:
+            return self.relation()
+        left = self.random.randint(1, size - 1)
+        roll = self.random.random()
+        if roll < 0.1:
+            return f"!({self.boolean(left)}) && {self.boolean(size - left)}"
+        operator = '&&' if roll < 0.6 else '||'
+        return f"{self.boolean(left)} {operator} {self.boolean(size - left)}"
+
+    def conjunction(self, size):
+        """ size relational tests joined by &&, a || in a loop condition would skip the loop counter """
+        return " && ".join(self.relation() for _ in range(size))
+
+    def relation(self):
+        """ a relational test of a variable, a test of two literals would be decided at compile time """
+        if self.random.random() < 0.2:
+            name = self.random.choice(self.floats)
+        else:
+            name = self.random.choice(self.ints)
+        return f"{name} {self.random.choice(RELOPS)} {self.expression(False, 1)}"
+
+    def expression(self, real, terms=None):
+        """ an arithmetic expression, of type float when real is set (ints are promoted) """
+        if terms is None:
+            terms = self.random.randint(1, 4)
+        text = self.factor(real)
+        for _ in range(terms - 1):
+            operator = self.random.choice('+-*/')
+            if operator == '/':
+                # only nonzero literal divisors, so the programs never fault
+                text = f"{text} / {self.random.randint(1, 9)}"
+            else:
+                text = f"{text} {operator} {self.factor(real)}"
+        return text
+
+    def factor(self, real):
+        roll = self.random.random()
+        if roll < 0.3:
+            return str(self.random.randint(0, 99))
+        if real and roll < 0.4:
+            return f"{self.random.randint(0, 9)}.{self.random.randint(0, 9)}"
+        if real and roll < 0.55:
+            return self.random.choice(self.floats)
+        if not real and roll < 0.35:
+            return f"cast<int>({self.random.choice(self.floats)})"
+        if roll < 0.45:
+            return f"({self.expression(real, 2)})"
+        return self.random.choice(self.ints)
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="writes a random CPL program to stdout")
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--lines", type=int, default=None, help="about this many lines")
+    arg_parser.add_argument("--statements", type=int, default=None, help="this many top level statements")
+    arg_parser.add_argument("--declarations", type=int, default=16)
+    arg_parser.add_argument("--depth", type=int, default=3)
+    arg_parser.add_argument("--bool-size", type=int, default=2)
+    args = arg_parser.parse_args()
+    generator = ProgramGenerator(args.seed, args.declarations, args.depth, args.bool_size)
+    sys.stdout.write(generator.program(args.statements, args.lines))
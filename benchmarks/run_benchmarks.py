@@ -0,0 +1,182 @@
+""" runs the compiler phases on generated programs of growing size and times every phase
+    on its own: lexing, parsing, ast.gen(), the optimizer passes and writing the .qud file.
+    the results are written as JSON, and a run can be compared against the results of an
+    earlier one (of another commit) to catch phases that got slower or stopped scaling.
+
+    python benchmarks/run_benchmarks.py --output results.json
+    python benchmarks/run_benchmarks.py --sizes 1000,10000 --compare results.json
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stderr, redirect_stdout
+from io import StringIO
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, os.pardir, 'src'))
+
+from cpl_generator import ProgramGenerator
+from session import CompileSession
+from optimizer import Optimizer
+from cpq import FileHandling
+from fast_lexer import LEXERS
+
+# bump when the layout of the results changes
+RESULTS_VERSION = 2
+
+DEFAULT_SIZES = (1000, 10000, 100000, 1000000)
+
+# every optimizer pass is timed as a phase of its own
+PHASES = ('lex', 'parse', 'gen') + Optimizer.PASSES + ('write',)
+
+# a phase has to lose at least this much time to count as slower, short phases are mostly noise
+MIN_SLOWDOWN = 0.01
+
+
+def commit_id():
+    """ the commit the benchmarks run on, None outside a git checkout """
+    try:
+        output = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCHMARKS_DIR,
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.strip() or None
+
+
+def measure(function, *args):
+    """ returns the result of the call and the wall time it took """
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def run_once(text, directory, lexer):
+    """ compiles text phase by phase, returns the phase times and the counts of what they made """
+    session = CompileSession(lexer=lexer)
+    times = {}
+    tokens, times['lex'] = measure(lambda: list(session.lexer.tokenize(text)))
+    ast, times['parse'] = measure(session.parser.parse, iter(tokens))
+    if ast is None:
+        raise RuntimeError("the generated program does not parse:\n" + "\n".join(session.diagnostics.messages))
+    token_count = len(tokens)
+    commands, times['gen'] = measure(ast.gen, session.interpreter)
+    quads = len(commands)
+    # the later phases run without the tokens and the tree, like they do in a compile
+    del tokens, ast
+    optimizer = Optimizer(session.interpreter.table)
+    for name in Optimizer.PASSES:
+        commands, times[name] = measure(getattr(optimizer, name), commands)
+    if session.diagnostics.found_errors:
+        raise RuntimeError("the generated program has errors:\n" + "\n".join(session.diagnostics.messages))
+
+    io = FileHandling()
+    io.filename = os.path.join(directory, 'bench')
+    with redirect_stdout(StringIO()), redirect_stderr(StringIO()):
+        _, times['write'] = measure(io.write_output_file, commands)
+    counts = {'tokens': token_count, 'quads': quads, 'optimized_quads': len(commands)}
+    return times, counts
+
+
+def run_size(lines, args, directory):
+    """ benchmarks one program size, every phase keeps its best time of the repeats """
+    generator = ProgramGenerator(args.seed, args.declarations, args.depth, args.bool_size)
+    text = generator.program(lines=lines)
+    best = None
+    for _ in range(args.repeat):
+        gc.collect()
+        times, counts = run_once(text, directory, args.lexer)
+        best = times if best is None else {phase: min(best[phase], times[phase]) for phase in PHASES}
+    result = {'lines': lines, 'source_lines': text.count('\n'), 'bytes': len(text)}
+    result.update(counts)
+    result['seconds'] = best
+    result['total'] = sum(best.values())
+    return result
+
+
+def run(args):
+    results = {
+        'version': RESULTS_VERSION,
+        'commit': commit_id(),
+        'python': platform.python_version(),
+        'generator': {'seed': args.seed, 'declarations': args.declarations, 'depth': args.depth,
+                      'bool_size': args.bool_size},
+        'lexer': args.lexer,
+        'repeat': args.repeat,
+        'sizes': [],
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        for lines in args.sizes:
+            result = run_size(lines, args, directory)
+            results['sizes'].append(result)
+            print(f"{lines:>8} lines  " + "  ".join(f"{phase} {result['seconds'][phase]:8.3f}s" for phase in PHASES) +
+                  f"  total {result['total']:8.3f}s", file=sys.stderr)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """ prints the time of every phase against the baseline, returns the number of phases that
+        got slower than threshold times their baseline time """
+    if baseline.get('generator') != results['generator']:
+        print("warning: the baseline was generated with other generator settings", file=sys.stderr)
+    if baseline.get('version') != results['version']:
+        print("warning: the baseline has another results version, its missing phases are skipped", file=sys.stderr)
+    width = max(len(phase) for phase in PHASES)
+    base_sizes = {entry['lines']: entry for entry in baseline.get('sizes', ())}
+    regressions = 0
+    for entry in results['sizes']:
+        base = base_sizes.get(entry['lines'])
+        if base is None:
+            continue
+        for phase in PHASES + ('total',):
+            if phase != 'total' and phase not in base['seconds']:
+                continue
+            now = entry['seconds'][phase] if phase != 'total' else entry['total']
+            before = base['seconds'][phase] if phase != 'total' else base['total']
+            ratio = now / before if before else float('inf')
+            mark = ''
+            if ratio > threshold and now - before > MIN_SLOWDOWN and phase != 'total':
+                regressions += 1
+                mark = '  SLOWER'
+            print(f"{entry['lines']:>8} lines  {phase:<{width}} {before:8.3f}s -> {now:8.3f}s  x{ratio:5.2f}{mark}")
+    return regressions
+
+
+def parse_arguments(argv):
+    arg_parser = argparse.ArgumentParser(description="times the compiler phases on generated CPL programs")
+    arg_parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES),
+                            help="comma separated program sizes in lines (default: %(default)s)")
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--declarations", type=int, default=16)
+    arg_parser.add_argument("--depth", type=int, default=3, help="nesting depth of while, switch and if")
+    arg_parser.add_argument("--bool-size", type=int, default=2, help="relational tests per boolean expression")
+    arg_parser.add_argument("--lexer", choices=sorted(LEXERS), default="fast")
+    arg_parser.add_argument("--repeat", type=int, default=1, help="runs per size, the best time is kept")
+    arg_parser.add_argument("--output", help="write the results to this JSON file (default: stdout)")
+    arg_parser.add_argument("--compare", metavar="JSON", help="compare against the results of an earlier run")
+    arg_parser.add_argument("--threshold", type=float, default=1.25,
+                            help="a phase this many times slower than the baseline is a regression")
+    args = arg_parser.parse_args(argv)
+    args.sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    args.repeat = max(1, args.repeat)
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_arguments(sys.argv[1:])
+    results = run(args)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    elif not args.compare:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    if args.compare:
+        with open(args.compare, 'r') as file:
+            baseline = json.load(file)
+        sys.exit(1 if compare(results, baseline, args.threshold) else 0)
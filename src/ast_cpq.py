@@ -1,38 +1,76 @@
 """ this file responsible for making the ast nodes
     each node has a function "gen" that generates the code
-    with the help of the interpreter class.
+    with the help of the interpreter of the compile it is given.
 """
-from interpreter import Interpreter,Success
-
-AST = Interpreter()
+import functools
+import sys
 
 class ASTNode(object):
 
-    def gen(self):
+    def gen(self, interp):
         pass
 
+
+def source_line(gen):
+    """ marks the quads generated by the gen of a node with the source line of the node """
+    @functools.wraps(gen)
+    def marked(self, interp):
+        first = len(interp.commands)
+        result = gen(self, interp)
+        interp.mark_source_line(first, self.lineno)
+        return result
+    return marked
+
+
+def left_chain(node):
+    """ the grammar is left recursive, so lists of statements, declarations and ids are
+        chains of nodes leaning left, one node per item. returns an iterator over the
+        leftmost node and then the right child of every chain node, in source order,
+        without recursing down the chain """
+    chain_type = type(node)
+    rights = []
+    while type(node) is chain_type:
+        rights.append(node.right)
+        node = node.left
+    rights.append(node)
+    return reversed(rights)
+
+
+def count_nodes(root):
+    """ the number of nodes in the tree under root, counted without recursing """
+    count = 0
+    pending = [root]
+    while pending:
+        node = pending.pop()
+        if isinstance(node, ASTNode):
+            count += 1
+            pending.extend(vars(node).values())
+        elif isinstance(node, (list, tuple)):
+            pending.extend(node)
+    return count
+
 class ProgramNode(ASTNode):
     def __init__(self, declarations, stmt_block):
         self.declarations = declarations
         self.stmt_block = stmt_block
 
-    def gen(self):
-        self.declarations.gen()
-        stmt_labels = self.stmt_block.gen()
-        return AST.handle_Program(stmt_labels, AST.insert_halt())
+    def gen(self, interp):
+        self.declarations.gen(interp)
+        stmt_labels = self.stmt_block.gen(interp)
+        return interp.handle_Program(stmt_labels, interp.insert_halt())
 
 class DeclarationsNode(ASTNode):
     def __init__(self, declarations, declaration):
         self.left = declarations
         self.right = declaration
 
-    def gen(self):
-        self.left.gen()
-        self.right.gen()
+    def gen(self, interp):
+        for declaration in left_chain(self):
+            declaration.gen(interp)
 
 class EpsilonNode(ASTNode):
-    def gen(self):
-        return AST.handle_epsilon()
+    def gen(self, interp):
+        return interp.handle_epsilon()
 
 class DeclarationNode(ASTNode):
     def __init__(self, id_list, type_node, lineno):
@@ -40,9 +78,9 @@ class DeclarationNode(ASTNode):
         self.type_node = type_node
         self.lineno = lineno
 
-    def gen(self):
-        self.id_list.gen()
-        self.type_node.gen()
+    def gen(self, interp):
+        self.id_list.gen(interp)
+        self.type_node.gen(interp)
 
 class IdListNode(ASTNode):
     def __init__(self, left, right, lineno):
@@ -50,25 +88,25 @@ class IdListNode(ASTNode):
         self.right = right
         self.lineno = lineno
 
-    def gen(self):
-        self.left.gen()
-        self.right.gen()
+    def gen(self, interp):
+        for id_ in left_chain(self):
+            id_.gen(interp)
 
 class TypeNode(ASTNode):
     def __init__(self, type_ ,lineno):
         self.type_ = type_
         self.lineno = lineno
 
-    def gen(self):
-        AST.declare_variables(self.type_)
+    def gen(self, interp):
+        interp.declare_variables(self.type_)
 
 class IdNode(ASTNode):
     def __init__(self, id_, lineno):
-        self.id_ = id_
+        self.id_ = sys.intern(id_)
         self.lineno = lineno
 
-    def gen(self):
-        AST.load_variable(self.id_, self.lineno)
+    def gen(self, interp):
+        interp.load_variable(self.id_, self.lineno)
         return self.id_
 
 class AssignmentNode(ASTNode):
@@ -77,23 +115,27 @@ class AssignmentNode(ASTNode):
         self.expression = expression
         self.lineno = lineno
 
-    def gen(self):
-        return AST.handle_assignment(self.id_.gen(), self.expression.gen(), self.lineno)
+    @source_line
+    def gen(self, interp):
+        return interp.handle_assignment(self.id_.gen(interp), self.expression.gen(interp), self.lineno)
 
 class InputNode(ASTNode):
-    def __init__(self, id_):
+    def __init__(self, id_, lineno):
         self.id_ = id_
+        self.lineno = lineno
 
-    def gen(self):
-        return AST.handle_input(self.id_.gen())
+    @source_line
+    def gen(self, interp):
+        return interp.handle_input(self.id_.gen(interp))
 
 class OutputNode(ASTNode):
     def __init__(self, expression, lineno):
         self.expression = expression
         self.lineno = lineno
 
-    def gen(self):
-        return AST.handle_output(self.expression.gen(), self.lineno)
+    @source_line
+    def gen(self, interp):
+        return interp.handle_output(self.expression.gen(interp), self.lineno)
 
 class IfNode(ASTNode):
     def __init__(self, boolean_expr, true_stmt, false_stmt, lineno):
@@ -102,21 +144,22 @@ class IfNode(ASTNode):
         self.false_stmt = false_stmt
         self.lineno = lineno
 
-    def gen(self):
-        bool_expr = self.boolean_expr.gen()
-        true_line = AST.next_statement_line()
-        true_body = self.true_stmt.gen()
-        else_line = AST.create_else_jump()
-        false_line = AST.next_statement_line()
-        false_body = self.false_stmt.gen()
-        return AST.handle_ifStatement(bool_expr, true_line, else_line, false_line, true_body, false_body)
+    @source_line
+    def gen(self, interp):
+        bool_expr = self.boolean_expr.gen(interp)
+        true_line = interp.next_statement_line()
+        true_body = self.true_stmt.gen(interp)
+        else_line = interp.create_else_jump()
+        false_line = interp.next_statement_line()
+        false_body = self.false_stmt.gen(interp)
+        return interp.handle_ifStatement(bool_expr, true_line, else_line, false_line, true_body, false_body)
 
 class StmtBlockNode(ASTNode):
     def __init__(self, stmt):
         self.stmt = stmt
 
-    def gen(self):
-        return self.stmt.gen()
+    def gen(self, interp):
+        return self.stmt.gen(interp)
 
 class WhileNode(ASTNode):
     def __init__(self, boolean_expr, stmt, lineno):
@@ -124,12 +167,13 @@ class WhileNode(ASTNode):
         self.stmt = stmt
         self.lineno = lineno
 
-    def gen(self):
-        start_line = AST.start_while()
-        bool_expr = self.boolean_expr.gen()
-        stmt_line = AST.next_statement_line()
-        stmt_body = self.stmt.gen()
-        return AST.handle_whileStatement(bool_expr, start_line, stmt_line, stmt_body)
+    @source_line
+    def gen(self, interp):
+        start_line = interp.start_while()
+        bool_expr = self.boolean_expr.gen(interp)
+        stmt_line = interp.next_statement_line()
+        stmt_body = self.stmt.gen(interp)
+        return interp.handle_whileStatement(bool_expr, start_line, stmt_line, stmt_body)
 
 class SwitchNode(ASTNode):
     def __init__(self, expr, case_list, stmt_list, lineno):
@@ -138,13 +182,40 @@ class SwitchNode(ASTNode):
         self.stmt_list = stmt_list
         self.lineno = lineno
 
-    def gen(self):
-        expr_ = self.expr.gen()
-        AST.start_switch(expr_, self.lineno)
-        case_ = self.case_list.gen()
-        self.stmt_list.gen()
-        nextline = AST.current_line()
-        return AST.handle_switchStatement(case_, nextline)
+    @source_line
+    def gen(self, interp):
+        expr_ = self.expr.gen(interp)
+        interp.start_switch(expr_, self.lineno)
+        cases = self.cases()
+        if interp.use_switch_search(len(cases)):
+            return self.gen_search(interp, cases)
+        case_ = self.case_list.gen(interp)
+        self.stmt_list.gen(interp)
+        nextline = interp.current_line()
+        return interp.handle_switchStatement(case_, nextline)
+
+    def cases(self):
+        """ the case nodes in source order """
+        cases = []
+        node = self.case_list
+        while isinstance(node, CaseListNode):
+            cases.append(node)
+            node = node.case_list
+        return cases[::-1]
+
+    def gen_search(self, interp, cases):
+        """ all the case tests come first as a binary search, then the case arms,
+            each arm still ends with a jump out of the switch """
+        case_labels, default_labels = interp.start_switch_search([(case.num, case.lineno) for case in cases])
+        exits = []
+        for case in cases:
+            interp.start_case_arm(case_labels, case.num)
+            case.stmt_list.gen(interp)
+            exits.append(interp.end_case_arm())
+        interp.back_patching(default_labels, interp.current_line())
+        self.stmt_list.gen(interp)
+        nextline = interp.current_line()
+        return interp.handle_switchStatement(exits, nextline)
 
 class CaseListNode(ASTNode):
     def __init__(self, case_list, num, stmt_list, lineno):
@@ -153,30 +224,37 @@ class CaseListNode(ASTNode):
         self.stmt_list = stmt_list
         self.lineno = lineno
 
-    def gen(self):
-        c1 = self.case_list.gen()
-        else_label = AST.start_case(self.num, self.lineno)
-        s1 = self.stmt_list.gen()
-        nextline = AST.current_line()
-        return AST.handle_caseList(c1, else_label, s1, nextline)
+    def gen(self, interp):
+        c1 = self.case_list.gen(interp)
+        # the case lists before this one are marked with their own lines
+        first = len(interp.commands)
+        else_label = interp.start_case(self.num, self.lineno)
+        s1 = self.stmt_list.gen(interp)
+        nextline = interp.current_line()
+        result = interp.handle_caseList(c1, else_label, s1, nextline)
+        interp.mark_source_line(first, self.lineno)
+        return result
 
 class BreakNode(ASTNode):
     def __init__(self, lineno):
         self.lineno = lineno
 
-    def gen(self):
-        return AST.handle_breakStatement(self.lineno)
+    def gen(self, interp):
+        return interp.handle_breakStatement(self.lineno)
 
 class StatementListNode(ASTNode):
     def __init__(self, stmt_list, stmt):
         self.left = stmt_list
         self.right = stmt
 
-    def gen(self):
-        s1 = self.left.gen()
-        stmt_line = AST.next_statement_line()
-        s2 = self.right.gen()
-        return AST.handle_statementList(s1, s2, stmt_line)
+    def gen(self, interp):
+        stmts = left_chain(self)
+        s1 = next(stmts).gen(interp)
+        for stmt in stmts:
+            stmt_line = interp.next_statement_line()
+            s2 = stmt.gen(interp)
+            s1 = interp.handle_statementList(s1, s2, stmt_line)
+        return s1
 
 class BooleanExprNode(ASTNode):
     def __init__(self, operator, left, right, lineno):
@@ -185,19 +263,31 @@ class BooleanExprNode(ASTNode):
         self.right = right
         self.lineno = lineno
 
-    def gen(self):
-        return AST.handle_booleanExpression(
-            AST.next_statement_line(), self.operator,
-            self.left.gen(), self.right.gen(), self.lineno
-        )
+    def gen(self, interp):
+        # long && / || chains lean left as well, the jump line of a node is where its right side starts
+        chain = []
+        node = self
+        while type(node) is BooleanExprNode:
+            chain.append(node)
+            node = node.left
+        result = node.gen(interp)
+        for node in reversed(chain):
+            if node.operator == '||':
+                # a true left side falls through, it has to jump over the right side
+                result = interp.create_true_jump(result)
+            result = interp.handle_booleanExpression(
+                interp.next_statement_line(), node.operator,
+                result, node.right.gen(interp), node.lineno
+            )
+        return result
 
 class NotNode(ASTNode):
     def __init__(self, boolean_expr, lineno):
         self.boolean_expr = boolean_expr
         self.lineno = lineno
 
-    def gen(self):
-        return AST.handle_notExpression(self.boolean_expr.gen())
+    def gen(self, interp):
+        return interp.handle_notExpression(self.boolean_expr.gen(interp))
 
 class RelopNode(ASTNode):
     def __init__(self, operator, left_expr, right_expr, lineno):
@@ -206,10 +296,10 @@ class RelopNode(ASTNode):
         self.right_expr = right_expr
         self.lineno = lineno
 
-    def gen(self):
-        return AST.handle_relop(
-            AST.next_statement_line(), self.operator,
-            self.left_expr.gen(), self.right_expr.gen(), self.lineno
+    @source_line
+    def gen(self, interp):
+        return interp.handle_relop(
+            self.operator, self.left_expr.gen(interp), self.right_expr.gen(interp), self.lineno
         )
 
 class CastNode(ASTNode):
@@ -218,8 +308,8 @@ class CastNode(ASTNode):
         self.expression = expression
         self.lineno = lineno
 
-    def gen(self):
-        return AST.handle_cast(self.cast_type, self.expression.gen(), self.lineno)
+    def gen(self, interp):
+        return interp.handle_cast(self.cast_type, self.expression.gen(interp), self.lineno)
 
 class OperationNode(ASTNode):
     def __init__(self, operator, left, right, lineno):
@@ -228,24 +318,33 @@ class OperationNode(ASTNode):
         self.right = right
         self.lineno = lineno
 
-    def gen(self):
-        return AST.handle_math_operation(
-            self.operator, self.left.gen(), self.right.gen()
-        )
+    def gen(self, interp):
+        # long + - * / chains lean left as well
+        chain = []
+        node = self
+        while type(node) is OperationNode:
+            chain.append(node)
+            node = node.left
+        result = node.gen(interp)
+        for node in reversed(chain):
+            result = interp.handle_math_operation(
+                node.operator, result, node.right.gen(interp)
+            )
+        return result
 
 class IdfactorNode(ASTNode):
     def __init__(self, value, lineno):
-        self.value = value
+        self.value = sys.intern(value)
         self.lineno = lineno
 
-    def gen(self):
-        AST.check_variable(self.value, self.lineno)
+    def gen(self, interp):
+        interp.check_variable(self.value, self.lineno)
         return self.value
 
 class NumfactorNode(ASTNode):
     def __init__(self, value, lineno):
-        self.value = value
+        self.value = sys.intern(value)
         self.lineno = lineno
 
-    def gen(self):
+    def gen(self, interp):
         return self.value
@@ -0,0 +1,247 @@
+""" ControlFlowGraph - the basic blocks of a quad program and the edges between them
+    the graph is built from resolved commands (jump targets are 1 based lines) in linear time,
+    knows the dominators and natural loops of the program, and is lowered back into a list of
+    commands with the jump targets rewritten
+"""
+from interpreter import Command
+
+JUMPS = ('JMPZ', 'JUMP')
+
+
+class BasicBlock:
+    """ a run of commands that is only entered at its first command and only left after its last one.
+        target - the block the closing JUMP/JMPZ goes to, None when it jumps past the end of the program
+        fall   - the block control falls through to, None past the end of the program
+        idom   - the immediate dominator, set by ControlFlowGraph.dominators
+        first, last - the preorder numbers of the block and of the last block it dominates
+                      in the dominator tree, set by ControlFlowGraph.dominators
+    """
+    def __init__(self, index, commands):
+        self.index = index
+        self.commands = commands
+        self.target = None
+        self.fall = None
+        self.successors = []
+        self.predecessors = []
+        self.idom = None
+        self.first = self.last = -1
+        self.line = 0
+
+    def __repr__(self):
+        return f"<block {self.index}: {len(self.commands)} commands>"
+
+    def jumps(self):
+        """ whether the block ends with a JUMP or JMPZ """
+        return bool(self.commands) and self.commands[-1].opcode in JUMPS
+
+    def falls_through(self):
+        """ whether control can leave the block into the block laid out after it """
+        return not self.commands or self.commands[-1].opcode not in ('JUMP', 'HALT')
+
+
+class Loop:
+    """ a natural loop, blocks holds the header and every block that reaches a back edge
+        without passing through the header """
+    def __init__(self, header, latches, blocks):
+        self.header = header
+        self.latches = latches
+        self.blocks = blocks
+
+    def __repr__(self):
+        return f"<loop at block {self.header.index}: {len(self.blocks)} blocks>"
+
+
+class ControlFlowGraph:
+    """ the basic blocks of a program in layout order, entry is the first block """
+    def __init__(self, blocks):
+        self.blocks = blocks
+        self.link()
+
+    @classmethod
+    def build(cls, commands):
+        """ splits resolved commands into basic blocks, a block starts at the first line,
+            at every jump target and after every JUMP, JMPZ and HALT """
+        size = len(commands)
+        leaders = [False] * (size + 2)
+        leaders[1] = True
+        for line, command in enumerate(commands, start=1):
+            if command.opcode in JUMPS:
+                if 1 <= command.arg1 <= size + 1:
+                    leaders[command.arg1] = True
+                leaders[line + 1] = True
+            elif command.opcode == 'HALT':
+                leaders[line + 1] = True
+
+        blocks = []
+        block_at = [None] * (size + 2)
+        first = 1
+        for line in range(2, size + 2):
+            if leaders[line] or line == size + 1:
+                block_at[first] = BasicBlock(len(blocks), commands[first - 1:line - 1])
+                blocks.append(block_at[first])
+                first = line
+
+        for block in blocks:
+            if block.jumps():
+                block.target = block_at[block.commands[-1].arg1]
+        for block, after in zip(blocks, blocks[1:] + [None]):
+            if block.falls_through():
+                block.fall = after
+        return cls(blocks)
+
+    @property
+    def entry(self):
+        return self.blocks[0] if self.blocks else None
+
+    def link(self):
+        """ recomputes the successor and predecessor edges from target and fall """
+        for block in self.blocks:
+            block.successors = []
+            block.predecessors = []
+        for block in self.blocks:
+            for successor in (block.target, block.fall):
+                if successor is not None and successor not in block.successors:
+                    block.successors.append(successor)
+                    successor.predecessors.append(block)
+
+    def reverse_postorder(self):
+        """ the blocks reachable from the entry, every block before its successors
+            except along back edges """
+        if not self.blocks:
+            return []
+        order = []
+        visited = {self.entry.index}
+        stack = [(self.entry, iter(self.entry.successors))]
+        while stack:
+            block, successors = stack[-1]
+            for successor in successors:
+                if successor.index not in visited:
+                    visited.add(successor.index)
+                    stack.append((successor, iter(successor.successors)))
+                    break
+            else:
+                stack.pop()
+                order.append(block)
+        order.reverse()
+        return order
+
+    def remove_unreachable(self):
+        """ drops the blocks control never reaches from the entry and numbers the rest again,
+            returns the number of commands that were dropped """
+        reachable = {block.index for block in self.reverse_postorder()}
+        removed = sum(len(block.commands) for block in self.blocks if block.index not in reachable)
+        self.blocks = [block for block in self.blocks if block.index in reachable]
+        for index, block in enumerate(self.blocks):
+            block.index = index
+        self.link()
+        return removed
+
+    def dominators(self):
+        """ sets the immediate dominator of every reachable block (the entry is its own),
+            with the iterative algorithm of Cooper, Harvey and Kennedy. returns the blocks in
+            reverse postorder """
+        order = self.reverse_postorder()
+        number = {block.index: position for position, block in enumerate(order)}
+        for block in self.blocks:
+            block.idom = None
+        if not order:
+            return order
+        entry = order[0]
+        entry.idom = entry
+
+        def intersect(first, second):
+            while first is not second:
+                while number[first.index] > number[second.index]:
+                    first = first.idom
+                while number[second.index] > number[first.index]:
+                    second = second.idom
+            return first
+
+        changed = True
+        while changed:
+            changed = False
+            for block in order[1:]:
+                idom = None
+                for predecessor in block.predecessors:
+                    if predecessor.idom is not None:
+                        idom = predecessor if idom is None else intersect(predecessor, idom)
+                if idom is not block.idom:
+                    block.idom = idom
+                    changed = True
+        self.number_dominator_tree(order)
+        return order
+
+    def number_dominator_tree(self, order):
+        """ numbers the dominator tree in preorder without recursing, a block dominates
+            the blocks numbered from its first to its last number """
+        for block in self.blocks:
+            block.first = block.last = -1
+        children = {block.index: [] for block in order}
+        for block in order[1:]:
+            children[block.idom.index].append(block)
+        number = 0
+        pending = [(order[0], False)]
+        while pending:
+            block, done = pending.pop()
+            if done:
+                block.last = number - 1
+                continue
+            block.first = number
+            number += 1
+            pending.append((block, True))
+            pending.extend((child, False) for child in reversed(children[block.index]))
+
+    def dominates(self, dominator, block):
+        """ whether every path from the entry to block passes dominator, needs dominators() """
+        return dominator.first >= 0 and dominator.first <= block.first <= dominator.last
+
+    def loops(self):
+        """ finds the natural loops, one per header, outer loops before the loops they hold """
+        order = self.dominators()
+        latches = {}
+        for block in order:
+            for successor in block.successors:
+                if self.dominates(successor, block):
+                    latches.setdefault(successor.index, (successor, []))[1].append(block)
+
+        loops = []
+        for header, ends in latches.values():
+            body = {header.index: header}
+            pending = [latch for latch in ends if latch.index not in body]
+            for latch in pending:
+                body[latch.index] = latch
+            while pending:
+                block = pending.pop()
+                for predecessor in block.predecessors:
+                    if predecessor.index not in body and predecessor.idom is not None:
+                        body[predecessor.index] = predecessor
+                        pending.append(predecessor)
+            loops.append(Loop(header, ends, sorted(body.values(), key=lambda block: block.index)))
+        loops.sort(key=lambda loop: -len(loop.blocks))
+        return loops
+
+    def lower(self):
+        """ lays the blocks out in order and returns their commands with the jump targets
+            rewritten, a JUMP is added where a block no longer falls into the block after it """
+        line = 1
+        closing = []
+        for position, block in enumerate(self.blocks):
+            block.line = line
+            after = self.blocks[position + 1] if position + 1 < len(self.blocks) else None
+            needs_jump = block.falls_through() and block.fall is not after
+            closing.append(needs_jump)
+            line += len(block.commands) + needs_jump
+        end = line
+
+        commands = []
+        for block, needs_jump in zip(self.blocks, closing):
+            commands.extend(block.commands)
+            if block.jumps():
+                block.commands[-1].arg1 = end if block.target is None else block.target.line
+            if needs_jump:
+                source_line = block.commands[-1].lineno if block.commands else None
+                jump = Command('JUMP', end if block.fall is None else block.fall.line, lineno=source_line)
+                block.commands.append(jump)
+                commands.append(jump)
+                block.target, block.fall = block.fall, None
+        return commands
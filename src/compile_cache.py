@@ -0,0 +1,136 @@
+""" CompileCache - content addressed cache of compiled quad programs
+    an entry holds the final optimized quad lines of one compile and the diagnostics it
+    reported (warnings, a compile with errors is not cached), and is keyed by a hash of
+    the source text, the compiler version and the compile options. the cache is bounded in
+    size, the least recently used entries are evicted first (a hit refreshes an entry)
+"""
+import hashlib
+import json
+import os
+import sys
+import threading
+from tablecache import default_cache_dir
+
+# default size bound of the cache directory
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# buffer size of the entry files, the lines of an entry are written through it one by one
+WRITE_BUFFER = 1024 * 1024
+
+# bump when the layout of an entry changes, it is part of the key
+ENTRY_FORMAT = 2
+
+# the modules whose code decides what a compile produces
+COMPILER_MODULES = ('lexer_cpq', 'parser_cpq', 'ast_cpq', 'interpreter', 'optimizer', 'session', 'quadvm', 'cfg',
+                    'fast_lexer')
+
+_fingerprint = None
+
+
+def compiler_fingerprint():
+    """ hashes the code of the compiler modules, so any change to the compiler invalidates the cache.
+        a frozen build has no sources and relies on the compiler version alone """
+    global _fingerprint
+    if _fingerprint is None:
+        digest = hashlib.sha256()
+        for name in COMPILER_MODULES:
+            module = sys.modules.get(name)
+            try:
+                with open(module.__file__, 'rb') as file:
+                    digest.update(file.read())
+            except (AttributeError, TypeError, OSError):
+                digest.update(name.encode())
+        _fingerprint = digest.hexdigest()
+    return _fingerprint
+
+
+class CompileCache:
+    """ the cache directory of the compiled quads, usage is the size the cache is
+        believed to have, it is measured on the first store and rescanned before evicting """
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES, version=''):
+        self.directory = os.path.join(directory or default_cache_dir(), 'quads')
+        self.max_bytes = max_bytes
+        self.version = version
+        self.usage = None
+
+    def key(self, source, options=None):
+        """ the cache key of compiling source (text, or the bytes of a mapped file) with the given options """
+        digest = hashlib.sha256()
+        digest.update(f"{self.version}\n{ENTRY_FORMAT}\n{compiler_fingerprint()}\n".encode())
+        digest.update(repr(sorted((options or {}).items())).encode())
+        digest.update(b'\n')
+        digest.update(source.encode() if isinstance(source, str) else source)
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key):
+        """ returns the cached (quad lines, diagnostics), or None.
+            an entry starts with the number of its diagnostics and the diagnostics as JSON strings """
+        path = self.path(key)
+        try:
+            with open(path, 'r') as file:
+                lines = file.read().split('\n')
+            os.utime(path)
+            count = int(lines[0])
+            diagnostics = [json.loads(line) for line in lines[1:count + 1]]
+        except (OSError, ValueError):
+            return None
+        return lines[count + 1:], diagnostics
+
+    def put(self, key, quad_lines, diagnostics=()):
+        """ stores the quad lines (strings or Command objects) of a compile and its diagnostics,
+            one line at a time, then evicts entries past the size bound """
+        path = self.path(key)
+        temp_name = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(temp_name, 'w', buffering=WRITE_BUFFER) as file:
+                file.write(f"{len(diagnostics)}\n")
+                file.writelines(f"{json.dumps(message)}\n" for message in diagnostics)
+                lines = iter(quad_lines)
+                for line in lines:
+                    file.write(str(line))
+                    break
+                file.writelines(f"\n{line}" for line in lines)
+                size = file.tell()
+            os.replace(temp_name, path)
+        except OSError:
+            return
+        if self.usage is None:
+            self.usage = self.scan()[1]
+        else:
+            self.usage += size
+        if self.usage > self.max_bytes:
+            self.evict()
+
+    def scan(self):
+        """ returns the (mtime, size, path) of every entry and their total size """
+        entries = []
+        total = 0
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    status = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((status.st_mtime, status.st_size, path))
+                total += status.st_size
+        return entries, total
+
+    def evict(self):
+        """ removes the least recently used entries until the cache is back under 90% of its
+            size bound, the slack keeps the directory from being rescanned on every store """
+        entries, total = self.scan()
+        limit = self.max_bytes * 9 // 10
+        for _, size, path in sorted(entries):
+            if total <= limit:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self.usage = total
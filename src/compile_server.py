@@ -0,0 +1,188 @@
+""" CompileServer - a long lived compile daemon on a local Unix socket
+    the grammar tables and the compiler stay loaded between requests, so a compile costs
+    only the compile itself. the protocol is one JSON object per line in each direction,
+    a client may send any number of requests over one connection.
+    request  - {"source": "<CPL text>"} or {"path": "<file>.ou"}, with "metrics": true the
+               compile is measured phase by phase (and doesn't use the cache), with "cache": false
+               it doesn't use the cache either. "options": {"switch_search_min": N, "lexer": name}
+               sets CompileSession options of this compile over the ones the server runs with
+    response - {"ok": bool, "parsed": bool, "quads": [lines], "diagnostics": [messages], "stats": {...}}
+               and "phases": [{"name", "seconds", "counts", ...}] for a measured compile,
+               or {"ok": false, "error": "<message>"} for a request that could not be served
+"""
+import json
+import os
+import socket
+import socketserver
+from tablecache import default_cache_dir
+from session import CompileSession
+from fast_lexer import LEXERS
+from phase_metrics import PhaseMetrics
+
+# the CompileSession options a request may set, and the test of their values
+REQUEST_OPTIONS = {
+    'switch_search_min': lambda value: isinstance(value, int) and not isinstance(value, bool) and value >= 0,
+    'lexer': lambda value: isinstance(value, str) and value in LEXERS,
+}
+
+
+def default_socket_path():
+    """ the socket of the compile server """
+    return os.environ.get('CPQ_SOCKET') or os.path.join(default_cache_dir(), 'cpq.sock')
+
+
+def request_options(request, options):
+    """ the CompileSession options of the server with the ones the request sets,
+        or the error message of an option it can't set """
+    options = dict(options or {})
+    requested = request.get('options', {})
+    if not isinstance(requested, dict):
+        return "Request options are not an object."
+    for name, value in requested.items():
+        if name not in REQUEST_OPTIONS:
+            return f"Unknown option '{name}'."
+        if not REQUEST_OPTIONS[name](value):
+            return f"Illegal value {value!r} of option '{name}'."
+        options[name] = value
+    return options
+
+
+def handle_request(request, cache=None, options=None):
+    """ compiles one request with the CompileSession options of the server and the ones the
+        request sets, returns its response """
+    if 'source' in request:
+        source = request['source']
+    elif 'path' in request:
+        try:
+            with open(request['path'], 'r') as file:
+                source = file.read()
+        except (IOError, TypeError):
+            return {'ok': False, 'error': f"Failed to read the file '{request['path']}'."}
+    else:
+        return {'ok': False, 'error': "Request has no 'source' or 'path'."}
+    if not isinstance(source, str):
+        return {'ok': False, 'error': "Request source is not text."}
+    source = source.strip()
+    if not source:
+        return {'ok': False, 'error': "Unable to read file."}
+
+    options = request_options(request, options)
+    if isinstance(options, str):
+        return {'ok': False, 'error': options}
+
+    # tracemalloc is global to the process, the requests of other threads would be counted too
+    metrics = PhaseMetrics() if request.get('metrics') else None
+    if metrics is not None or request.get('cache') is False:
+        cache = None
+    if cache is not None:
+        key = cache.key(source, options)
+        entry = cache.get(key)
+        if entry is not None:
+            lines, diagnostics = entry
+            return {'ok': True, 'parsed': True, 'quads': lines, 'diagnostics': diagnostics, 'stats': {}}
+
+    result = CompileSession(**options, metrics=metrics).compile(source)
+    lines = result.lines()
+    if result.ok and cache is not None:
+        cache.put(key, lines, result.diagnostics)
+    response = {'ok': result.ok, 'parsed': result.parsed, 'quads': lines, 'diagnostics': result.diagnostics,
+                'stats': result.stats}
+    if metrics is not None:
+        response['phases'] = metrics.as_dict()['phases']
+    return response
+
+
+class CompileHandler(socketserver.StreamRequestHandler):
+    """ serves the requests of one connection until the client closes it """
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("request is not an object")
+            except ValueError as error:
+                response = {'ok': False, 'error': f"Malformed request: {error}"}
+            else:
+                try:
+                    response = handle_request(request, self.server.cache, self.server.options)
+                except Exception as error:
+                    response = {'ok': False, 'error': f"Internal compiler error: {error!r}"}
+            self.wfile.write(json.dumps(response).encode() + b'\n')
+            self.wfile.flush()
+
+
+class CompileServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """ handles every connection on its own thread, each request compiles in its own session """
+    daemon_threads = True
+
+    def __init__(self, socket_path, cache=None, options=None):
+        self.cache = cache
+        self.options = options
+        socketserver.UnixStreamServer.__init__(self, socket_path, CompileHandler)
+
+
+def serve(socket_path=None, cache=None, options=None):
+    """ runs the compile server until it is interrupted """
+    socket_path = socket_path or default_socket_path()
+    os.makedirs(os.path.dirname(os.path.abspath(socket_path)), exist_ok=True)
+    if os.path.exists(socket_path):
+        # a socket left behind by a server that is gone, a live server keeps it
+        if connect(socket_path) is not None:
+            raise OSError(f"a compile server is already running on '{socket_path}'")
+        os.remove(socket_path)
+    server = CompileServer(socket_path, cache, options)
+    print(f"Compile server listening on {socket_path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(socket_path)
+
+
+def connect(socket_path=None):
+    """ returns a socket connected to the compile server, or None if none is running """
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(socket_path or default_socket_path())
+    except OSError:
+        client.close()
+        return None
+    return client
+
+
+def compile_request(request, options=None, use_cache=True):
+    """ adds the CompileSession options and the cache switch to a request """
+    if options:
+        request['options'] = options
+    if not use_cache:
+        request['cache'] = False
+    return request
+
+
+class CompileClient:
+    """ sends compile requests to a running compile server over one connection """
+    def __init__(self, socket_path=None):
+        self.socket = connect(socket_path)
+        if self.socket is None:
+            raise OSError(f"no compile server is running on '{socket_path or default_socket_path()}'")
+        self.file = self.socket.makefile('rwb')
+
+    def request(self, request):
+        self.file.write(json.dumps(request).encode() + b'\n')
+        self.file.flush()
+        line = self.file.readline()
+        if not line:
+            raise OSError("the compile server closed the connection")
+        return json.loads(line)
+
+    def compile_source(self, text, options=None, use_cache=True):
+        return self.request(compile_request({'source': text}, options, use_cache))
+
+    def compile_path(self, path, options=None, use_cache=True):
+        return self.request(compile_request({'path': os.path.abspath(path)}, options, use_cache))
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
@@ -2,29 +2,50 @@
     FileHandling  - handles reading and writing from and into files
     Main - the main code that runs the whole compiler calls
 """
+import argparse
+import cProfile
 import os
 import sys
-from lexer_cpq import LexerCPQ
-from parser_cpq import ParserCPQ,Success
+from contextlib import redirect_stderr, redirect_stdout
+from io import StringIO
+from multiprocessing import Pool, freeze_support
+from session import CompileSession
+from interpreter import SWITCH_SEARCH_MIN
+from compile_server import CompileClient, serve
+from compile_cache import CompileCache, DEFAULT_MAX_BYTES
+from mapped_source import MappedSource
+from fast_lexer import LEXERS
+from phase_metrics import PhaseMetrics
+from quadvm import QuadProgram, QuadVM, QuadError
+from quadaot import AotProgram
+from quadprof import QuadProfiler, command_lines
+
+VERSION = "1.1"
+
+# sources of this size and above are memory mapped and lexed in chunks
+STREAM_THRESHOLD = 16 * 1024 * 1024
+
+# buffer size of the .qud writer
+WRITE_BUFFER = 1024 * 1024
 
 class FileHandling:
     def __init__(self):
         self.filename = ""
 
-    def read_input_file(self, args):
-        if len(args) != 2:
-            print("Error! Invalid argument count. Usage: python cpq.py <file_name>.ou")
-            return None
-
-        input_file = args[1]
+    def check_input_name(self, input_file):
         base_name, extension = os.path.splitext(input_file)
 
         if extension != ".ou" or not base_name:
             print("Error! Invalid file type. Expected .ou file.")
             sys.stderr.write("Liam Meshulam")
-            return None
+            return False
 
         self.filename = base_name
+        return True
+
+    def read_input_file(self, input_file):
+        if not self.check_input_name(input_file):
+            return None
 
         try:
             with open(input_file, "r") as file:
@@ -38,14 +59,33 @@ class FileHandling:
             print(f"Error: Failed to read the file '{input_file}'.")
             return None
 
+    def map_input_file(self, input_file):
+        """ memory maps a large input file instead of reading it, returns a MappedSource or None """
+        if not self.check_input_name(input_file):
+            return None
+
+        try:
+            source = MappedSource(input_file)
+        except IOError:
+            print(f"Error: Failed to read the file '{input_file}'.")
+            return None
+        if source.empty():
+            source.close()
+            print("Error! Unable to read file.")
+            sys.stderr.write("Liam Meshulam")
+            return None
+        return source
+
     def write_output_file(self, quad_commands):
+        """ streams the quad lines (strings or Command objects) into the .qud file """
         if not self.filename:  # Ensure we have a valid filename
             print("Error! Output filename is missing.")
             return
 
         output_file = f"{self.filename}.qud"
         try:
-            with open(output_file, "w") as file:
+            # the commands are formatted one at a time while they are written
+            with open(output_file, "w", buffering=WRITE_BUFFER) as file:
                 file.writelines(f"{cmd}\n" for cmd in quad_commands)
                 file.write("Liam Meshulam")
             print(f"Output written to {output_file}")
@@ -53,51 +93,365 @@ class FileHandling:
         except IOError:
             print(f"fio: Unable to write to file '{output_file}'.")
 
+    def write_source_map(self, quad_commands):
+        """ writes the .qmap side table, a line "<quad line> <source line>" for every quad
+            whose source line is known """
+        map_file = f"{self.filename}.qmap"
+        try:
+            with open(map_file, "w", buffering=WRITE_BUFFER) as file:
+                file.writelines(f"{line} {lineno}\n" for line, lineno in command_lines(quad_commands).items())
+            print(f"Source map written to {map_file}")
+        except IOError:
+            print(f"fio: Unable to write to file '{map_file}'.")
 
 
-if __name__ == '__main__':
-    io = FileHandling()
-    lexer = LexerCPQ()
-    parser = ParserCPQ()
-
-    file = io.read_input_file(sys.argv)
-    if file:
-        tokens = lexer.tokenize(file)
-        ast = parser.parse(tokens)
-        if ast is None:
-            print("Error! File has illegal syntax or is corrupted. Check above for details.")
-            sys.stderr.write("Liam Meshulam")
-            sys.exit(1)
+def parse_arguments(argv):
+    arg_parser = argparse.ArgumentParser(prog="cpq.py", description="CPL to Quad compiler")
+    source = arg_parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("file", nargs="?", help="<file_name>.ou source file")
+    source.add_argument("--batch", metavar="PATH",
+                        help="compile every .ou file in a directory, or every path listed in a file")
+    source.add_argument("--serve", action="store_true",
+                        help="run a compile server that keeps the compiler loaded, on a local Unix socket")
+    arg_parser.add_argument("--jobs", type=int, default=None,
+                            help="worker processes for --batch (default: one per CPU)")
+    arg_parser.add_argument("--remote", action="store_true", help="compile on the running compile server")
+    arg_parser.add_argument("--socket", help="socket of the compile server (default: ~/.cache/cpq/cpq.sock)")
+    arg_parser.add_argument("--run", action="store_true", help="run the compiled program on the Quad VM")
+    arg_parser.add_argument("--engine", choices=("vm", "aot"), default="vm",
+                            help="what --run runs the program on: the Quad VM, or the program translated "
+                                 "into Python and compiled (cached) for faster runs (default: %(default)s)")
+    arg_parser.add_argument("--profile-run", action="store_true",
+                            help="run the compiled program on the Quad VM and print the run counts and times "
+                                 "of its instructions, source lines and loops")
+    arg_parser.add_argument("--profile-json", metavar="JSON", help="run the program profiled and write the profile "
+                                                                    "as JSON")
+    arg_parser.add_argument("--source-map", action="store_true",
+                            help="write the source line of every quad into a <file_name>.qmap side table")
+    arg_parser.add_argument("--stream", action="store_true", default=None,
+                            help="memory map the source and lex it in chunks (default: for files of 16 MB and up)")
+    arg_parser.add_argument("--switch-search", type=int, default=SWITCH_SEARCH_MIN, metavar="N",
+                            help="test the cases of switches with N or more cases with a binary search "
+                                 "(default: %(default)s, 0 never does)")
+    arg_parser.add_argument("--lexer", choices=sorted(LEXERS), default="fast",
+                            help="the regex lexer, or the SLY lexer it is checked against (default: %(default)s)")
+    arg_parser.add_argument("--stats", action="store_true",
+                            help="print what the optimizer changed, including the number of temps left")
+    arg_parser.add_argument("--no-cache", action="store_true", help="always compile, don't use the compile cache")
+    arg_parser.add_argument("--cache-dir", help="directory of the compile cache (default: ~/.cache/cpq)")
+    arg_parser.add_argument("--cache-size", type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024),
+                            metavar="MB", help="size bound of the compile cache in megabytes")
+    arg_parser.add_argument("--time-phases", action="store_true",
+                            help="print the time, memory and token/node/quad counts of every compile phase")
+    arg_parser.add_argument("--trace-memory", action=argparse.BooleanOptionalAction, default=True,
+                            help="measure the memory of the phases with tracemalloc, it slows the compile "
+                                 "down (default: on)")
+    arg_parser.add_argument("--trace", metavar="JSON", help="write the phases as a JSON trace (chrome://tracing)")
+    arg_parser.add_argument("--profile", metavar="FILE", help="profile the compile and dump the pstats to FILE")
+    args = arg_parser.parse_args(argv)
+    if (args.time_phases or args.trace or args.profile) and (args.batch or args.serve or args.remote):
+        arg_parser.error("--time-phases, --trace and --profile measure a single local compile")
+    if (args.source_map or args.profile_run or args.profile_json) and (args.batch or args.serve or args.remote):
+        arg_parser.error("--source-map, --profile-run and --profile-json need a single local compile")
+    if (args.profile_run or args.profile_json) and args.engine != "vm":
+        arg_parser.error("--profile-run and --profile-json run the program on the Quad VM")
+    return args
+
+
+def compile_options(args):
+    """ the CompileSession options selected by the command line """
+    return {'switch_search_min': args.switch_search, 'lexer': args.lexer}
+
+
+def compile_cache(args):
+    """ the compile cache selected by the command line, None when it is switched off """
+    if args.no_cache:
+        return None
+    return CompileCache(args.cache_dir, args.cache_size * 1024 * 1024, VERSION)
+
 
-        code = ast.gen()
+def phase_metrics(args):
+    """ the PhaseMetrics selected by the command line, None when the phases aren't measured """
+    if not (args.time_phases or args.trace):
+        return None
+    return PhaseMetrics(trace_memory=args.trace_memory)
 
-        optimized = []
-        removable = set()
-        jumps = []
 
-        # finds redundant jumps and track jump instructions
-        for idx, line in enumerate(code):
-            tokens = line.split()
+def report_metrics(metrics, args):
+    """ prints the phase table and writes the trace file selected by the command line """
+    metrics.stop()
+    if args.time_phases:
+        for line in metrics.report():
+            print(line)
+    if args.trace:
+        try:
+            metrics.write_trace(args.trace)
+        except IOError:
+            print(f"fio: Unable to write to file '{args.trace}'.")
+
 
-            if tokens[0] == 'JUMP' and tokens[1] == str(idx + 2):
-                removable.add(idx)
-            elif tokens[0] in {'JMPZ', 'JUMP'}:
-                jumps.append(idx)
+def run_profiled(filename, function, *args):
+    """ calls function under cProfile and dumps the profile to filename, returns the result of the call """
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(function, *args)
+    finally:
+        try:
+            profiler.dump_stats(filename)
+            print(f"Profile written to {filename}")
+        except IOError:
+            print(f"fio: Unable to write to file '{filename}'.")
 
-            optimized.append(tokens)
 
-        # adjust jump targets if necessary
-        for removed_idx in sorted(removable, reverse=True):
-            for jump_idx in jumps:
-                target = int(optimized[jump_idx][1])
-                if target > removed_idx:
-                    optimized[jump_idx][1] = str(target - 1)
+def use_streaming(input_file, stream):
+    """ whether a source is memory mapped and lexed in chunks instead of read whole """
+    if stream is not None:
+        return stream
+    try:
+        return os.path.getsize(input_file) >= STREAM_THRESHOLD
+    except OSError:
+        return False
 
-        # remove redundant lines
-        optimized = [tokens for i, tokens in enumerate(optimized) if i not in removable]
 
-        res =  [' '.join(line) for line in optimized]
-        if Success.found_errors == 0:
+def compile_file(input_file, cache=None, stream=None, show_stats=False, options=None, metrics=None,
+                 source_map=False):
+    """ compiles one .ou file into its .qud file, returns the quad commands (or the cached
+        quad lines) or None on failure.
+        with a cache, an unchanged source is not compiled again. stream selects the
+        memory mapped input path, by default it is used for large files.
+        show_stats prints what the optimizer changed, options are the CompileSession options,
+        metrics a PhaseMetrics that measures the phases (the cache is not used then),
+        source_map writes the .qmap file too (the cached quad lines have no source lines,
+        so the cache is not used either) """
+    io = FileHandling()
+    if use_streaming(input_file, stream):
+        source = io.map_input_file(input_file)
+    else:
+        source = io.read_input_file(input_file)
+    if not source:
+        return None
+    try:
+        return compile_input(source, io, cache, show_stats, options, metrics, source_map)
+    finally:
+        if isinstance(source, MappedSource):
+            source.close()
+
+
+def compile_input(source, io, cache, show_stats=False, options=None, metrics=None, source_map=False):
+    """ compiles source text or a MappedSource in a new session and writes the .qud file """
+    if metrics is not None or source_map:
+        cache = None
+    if cache is not None:
+        if isinstance(source, MappedSource):
+            with source.view() as view:
+                key = cache.key(view, options)
+        else:
+            key = cache.key(source, options)
+        entry = cache.get(key)
+        if entry is not None:
+            res, diagnostics = entry
+            # the warnings of the compile are reported again, a cached compile had no errors
+            report_diagnostics(diagnostics, True, True)
             io.write_output_file(res)
+            return res
+
+    result = CompileSession(**(options or {}), metrics=metrics).compile(source)
+    if not report_diagnostics(result.diagnostics, result.parsed, result.ok):
+        return None
+    commands = result.commands
+    if metrics is not None:
+        with metrics.phase('write') as phase:
+            io.write_output_file(commands)
+            phase.counts['lines'] = len(commands) + 1
+    else:
+        io.write_output_file(commands)
+    if source_map:
+        io.write_source_map(commands)
+    if show_stats:
+        report_stats(result.stats)
+    if cache is not None:
+        cache.put(key, commands, result.diagnostics)
+    return commands
+
+
+def report_stats(stats):
+    """ prints what the optimizer changed """
+    print("Optimizer: " + ", ".join(f"{name}={count}" for name, count in stats.items()))
+
+
+def report_diagnostics(diagnostics, parsed, ok):
+    """ prints the messages of a compile, returns whether the .qud file can be written """
+    for message in diagnostics:
+        print(message)
+    if not parsed:
+        print("Error! File has illegal syntax or is corrupted. Check above for details.")
+        sys.stderr.write("Liam Meshulam")
+        return False
+    if not ok:
+        print("syntax errors found aborting creation of .qud file")
+        return False
+    return True
+
+
+def compile_remote(input_file, socket_path=None, options=None, use_cache=True, show_stats=False):
+    """ compiles one .ou file on the compile server and writes its .qud file,
+        returns the quad lines or None on failure. options are the CompileSession options
+        the server compiles with, use_cache False compiles without its compile cache and
+        show_stats prints what the optimizer changed """
+    io = FileHandling()
+    if not io.check_input_name(input_file):
+        return None
+    try:
+        client = CompileClient(socket_path)
+        try:
+            response = client.compile_path(input_file, options, use_cache)
+        finally:
+            client.close()
+    except OSError as error:
+        print(f"Error! {error}")
+        return None
+
+    if 'error' in response:
+        print(f"Error! {response['error']}")
+        return None
+    if not report_diagnostics(response['diagnostics'], response['parsed'], response['ok']):
+        return None
+    io.write_output_file(response['quads'])
+    # a cache hit on the server has no stats, like a local one
+    if show_stats and response['stats']:
+        report_stats(response['stats'])
+    return response['quads']
+
+
+def run_program(quad_commands, engine="vm"):
+    """ runs the compiled quads on the built-in Quad VM, or translated into Python with engine "aot" """
+    try:
+        program = QuadProgram.decode(quad_commands)
+        if engine == "aot":
+            AotProgram.build(program).run()
+        else:
+            QuadVM().run(program)
+    except QuadError as error:
+        print(f"Runtime error! {error}")
+        sys.exit(1)
+
+
+def profile_program(quad_commands, input_file, json_file=None):
+    """ runs the compiled Commands on the QuadProfiler, prints the profile and writes it as JSON """
+    try:
+        profile = QuadProfiler().run(QuadProgram.decode(quad_commands))
+    except QuadError as error:
+        print(f"Runtime error! {error}")
+        sys.exit(1)
+    try:
+        with open(input_file, "r") as file:
+            source = file.read().strip()
+    except IOError:
+        source = None
+    profile.set_source(command_lines(quad_commands), source)
+    for line in profile.report():
+        print(line)
+    if json_file:
+        try:
+            profile.write_json(json_file)
+        except IOError:
+            print(f"fio: Unable to write to file '{json_file}'.")
+
+
+def batch_sources(path):
+    """ returns the .ou files of a directory (recursively), or the paths listed one per line in a file """
+    if os.path.isdir(path):
+        sources = []
+        for root, _, names in os.walk(path):
+            sources.extend(os.path.join(root, name) for name in names if name.endswith(".ou"))
+        return sorted(sources)
+    with open(path, "r") as file:
+        return [line.strip() for line in file if line.strip() and not line.startswith("#")]
+
+
+# settings of a batch worker process, set once by init_batch_worker
+_worker = {}
+
+
+def init_batch_worker(cache, stream, options):
+    _worker['cache'] = cache
+    _worker['stream'] = stream
+    _worker['options'] = options
+
+
+def batch_compile(input_file):
+    """ compiles one file inside a batch worker, returns (file, success, messages) """
+    messages = StringIO()
+    with redirect_stdout(messages), redirect_stderr(StringIO()):
+        try:
+            ok = compile_file(input_file, _worker['cache'], _worker['stream'],
+                              options=_worker['options']) is not None
+        except Exception as error:
+            print(f"Error! Internal compiler error: {error!r}")
+            ok = False
+    return input_file, ok, messages.getvalue()
+
+
+def run_batch(path, jobs=None, cache=None, stream=None, options=None):
+    """ compiles many files on a pool of worker processes, prints a status per file
+        and a summary. returns the number of files that failed """
+    try:
+        sources = batch_sources(path)
+    except IOError:
+        print(f"Error: Failed to read the batch list '{path}'.")
+        return 1
+
+    failed = 0
+    with Pool(processes=jobs, initializer=init_batch_worker, initargs=(cache, stream, options)) as pool:
+        chunksize = max(1, len(sources) // (4 * (jobs or os.cpu_count() or 1)))
+        for input_file, ok, messages in pool.imap(batch_compile, sources, chunksize):
+            if ok:
+                print(f"ok      {input_file}")
+            else:
+                failed += 1
+                print(f"FAILED  {input_file}")
+                for line in messages.splitlines():
+                    if not line.startswith("Output written to"):
+                        print(f"        {line}")
+
+    print(f"{len(sources) - failed} of {len(sources)} files compiled, {failed} failed")
+    return failed
+
+
+if __name__ == '__main__':
+    freeze_support()
+    args = parse_arguments(sys.argv[1:])
+    if args.batch:
+        failed = run_batch(args.batch, args.jobs, compile_cache(args), args.stream, compile_options(args))
+        sys.stderr.write("Liam Meshulam")
+        sys.exit(1 if failed else 0)
+
+    if args.serve:
+        try:
+            serve(args.socket, compile_cache(args), compile_options(args))
+        except OSError as error:
+            print(f"Error! {error}")
+            sys.exit(1)
+        sys.exit(0)
+
+    profile_run = args.profile_run or args.profile_json
+    if args.remote:
+        res = compile_remote(args.file, args.socket, compile_options(args), not args.no_cache, args.stats)
+    else:
+        metrics = phase_metrics(args)
+        # measured compiles always compile, a cache hit would measure nothing,
+        # and the cached quad lines have no source lines for the source map and the run profile
+        cache = compile_cache(args) if metrics is None and not (args.profile or profile_run) else None
+        compile_args = (args.file, cache, args.stream, args.stats, compile_options(args), metrics, args.source_map)
+        if args.profile:
+            res = run_profiled(args.profile, compile_file, *compile_args)
         else:
-            print("syntax errors found aborting creation of .qud file")
+            res = compile_file(*compile_args)
+        if metrics is not None:
+            report_metrics(metrics, args)
+    if res is None:
+        sys.exit(1)
+    if profile_run:
+        profile_program(res, args.file, args.profile_json)
+    elif args.run:
+        run_program(res, args.engine)
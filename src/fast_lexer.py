@@ -0,0 +1,166 @@
+""" FastLexerCPQ - a lexer for CPL that runs the token rules of LexerCPQ without SLY's token loop
+    the rules are joined with the literals and a catch all for illegal symbols into one master
+    regex that also takes the blanks in front of a token, every match is dispatched on the index
+    of its rule group and a token is a plain named tuple, so there are no rule methods to call
+    and no Token objects to fill in.
+    the tokens, line numbers and lexical errors are the same as those of LexerCPQ,
+    run this module on .ou files to check that
+"""
+import re
+import sys
+from collections import namedtuple
+from interpreter import Diagnostics
+from lexer_cpq import LexerCPQ
+
+FastToken = namedtuple('FastToken', 'type value lineno index end')
+
+# the actions of the rule groups, the ones up to KEYWORD are handled by the first test of the token loop
+SKIP, TOKEN, KEYWORD, LITERAL, NEWLINE, ERROR = range(6)
+
+# what the rule methods of LexerCPQ do to their tokens besides returning them,
+# a rule that isn't listed here returns its token unchanged
+RENAMED = {'lbrace': '{', 'rbrace': '}'}
+NEWLINE_RULE = 'newline'
+
+
+def uncaptured(pattern):
+    """ turns the unnamed groups of a regex into non capturing groups, so a match only
+        records the named rule groups """
+    parts = []
+    position = 0
+    in_class = False
+    while position < len(pattern):
+        char = pattern[position]
+        if char == '\\':
+            parts.append(pattern[position:position + 2])
+            position += 2
+            continue
+        if in_class:
+            in_class = char != ']'
+        elif char == '[':
+            in_class = True
+        elif char == '(' and not pattern.startswith('?', position + 1):
+            char = '(?:'
+        parts.append(char)
+        position += 1
+    return ''.join(parts)
+
+
+def build_master(lexer_cls):
+    """ returns the master regex of a sly lexer class extended with its literals and a catch all
+        for illegal symbols, and the (action, type) of every rule group by group index.
+        the blanks in front of a token are part of its match, so they need no match of their own """
+    blanks = re.escape(lexer_cls.ignore)
+    literals = ''.join(re.escape(literal) for literal in sorted(lexer_cls.literals))
+    pattern = (f"[{blanks}]*(?:{uncaptured(lexer_cls._master_re.pattern)}"
+               f"|(?P<_literal>[{literals}])|(?P<_error>[^{blanks}]))")
+    master = re.compile(pattern, lexer_cls._master_re.flags)
+
+    actions = [None] * (master.groups + 1)
+    for name, group in master.groupindex.items():
+        if name == '_literal':
+            actions[group] = (LITERAL, None)
+        elif name == '_error':
+            actions[group] = (ERROR, None)
+        elif name == NEWLINE_RULE:
+            actions[group] = (NEWLINE, None)
+        elif name in lexer_cls._ignored_tokens:
+            actions[group] = (SKIP, None)
+        elif name in lexer_cls._remapping:
+            actions[group] = (KEYWORD, name)
+        else:
+            actions[group] = (TOKEN, RENAMED.get(name, name))
+    return master, actions
+
+
+MASTER, ACTIONS = build_master(LexerCPQ)
+KEYWORDS = LexerCPQ._remapping['ID']
+
+
+class FastLexerCPQ:
+    def __init__(self, diagnostics=None):
+        self.diagnostics = diagnostics if diagnostics is not None else Diagnostics()
+        self.lineno = 1
+
+    def tokenize(self, text, lineno=1, index=0):
+        """ yields the tokens of text, self.lineno is the line the lexer stopped at """
+        actions = ACTIONS
+        keywords = KEYWORDS
+        new = tuple.__new__
+        token = FastToken
+        try:
+            for match in MASTER.finditer(text, index):
+                group = match.lastindex
+                action, kind = actions[group]
+                if action <= KEYWORD:
+                    start, end = match.span(group)
+                    value = text[start:end]
+                    if action == TOKEN:
+                        yield new(token, (kind, value, lineno, start, end))
+                    elif action == KEYWORD:
+                        yield new(token, (keywords.get(value, kind), value, lineno, start, end))
+                elif action == NEWLINE:
+                    start, end = match.span(group)
+                    lineno += end - start
+                elif action == LITERAL:
+                    start, end = match.span(group)
+                    value = text[start:end]
+                    yield new(token, (value, value, lineno, start, end))
+                else:
+                    self.diagnostics.report("Lexical error at line %s, symbol='%s'" % (lineno, match.group(group)),
+                                            error=False)
+        finally:
+            self.lineno = lineno
+
+    def tokenize_chunks(self, chunks):
+        """ tokenizes a source that arrives in chunks, line numbers carry on from chunk to chunk.
+            no token may span two chunks """
+        lineno = 1
+        for chunk in chunks:
+            yield from self.tokenize(chunk, lineno)
+            lineno = self.lineno
+
+
+# the lexers cpq.py can select
+LEXERS = {'fast': FastLexerCPQ, 'sly': LexerCPQ}
+
+
+def compare_lexers(text):
+    """ lexes text with LexerCPQ and FastLexerCPQ, returns a description of the first
+        difference in their tokens or lexical errors, or None when they agree """
+    lexers = LexerCPQ(), FastLexerCPQ()
+    streams = [lexer.tokenize(text) for lexer in lexers]
+    count = 0
+    while True:
+        tokens = [next(stream, None) for stream in streams]
+        if tokens[0] is None and tokens[1] is None:
+            break
+        fields = [None if tok is None else (tok.type, tok.value, tok.lineno, tok.index, tok.end) for tok in tokens]
+        if fields[0] != fields[1]:
+            return f"token {count}: sly {fields[0]}, fast {fields[1]}"
+        count += 1
+    messages = [lexer.diagnostics.messages for lexer in lexers]
+    if messages[0] != messages[1]:
+        return f"lexical errors: sly {messages[0]}, fast {messages[1]}"
+    return None
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("Error! Invalid argument count. Usage: python fast_lexer.py <file_name>.ou ...")
+        sys.exit(1)
+    failed = 0
+    for filename in sys.argv[1:]:
+        try:
+            with open(filename, "r") as file:
+                difference = compare_lexers(file.read().strip())
+        except IOError:
+            print(f"Error: Failed to read the file '{filename}'.")
+            failed += 1
+            continue
+        if difference is None:
+            print(f"same    {filename}")
+        else:
+            failed += 1
+            print(f"DIFFER  {filename}: {difference}")
+    sys.exit(1 if failed else 0)
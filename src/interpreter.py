@@ -1,22 +1,93 @@
 
+import sys
 from collections import OrderedDict
 
-class Success:
-    found_errors = 0
+class Diagnostics:
+    """ collects the messages of one compile in the order they are reported,
+        found_errors is set by every message that stops the .qud file from being written """
+    def __init__(self):
+        self.messages = []
+        self.found_errors = 0
+
+    def report(self, message, error=True):
+        self.messages.append(message)
+        if error:
+            self.found_errors = 1
+
+class PatchList:
+    """ labels that wait to be patched to the same target. joining lists is O(1), the joined
+        list only links its parts and the labels are collected when it is patched """
+    __slots__ = ('parts',)
+
+    def __init__(self, parts):
+        self.parts = parts
+
+    @staticmethod
+    def join(*lists):
+        """ the labels of all the lists (PatchLists or plain lists of labels), in order """
+        parts = tuple(part for part in lists if part)
+        if len(parts) == 1 and isinstance(parts[0], PatchList):
+            return parts[0]
+        return PatchList(parts)
+
+    def __bool__(self):
+        return bool(self.parts)
+
+    def __iter__(self):
+        pending = [iter(self.parts)]
+        while pending:
+            for part in pending[-1]:
+                if isinstance(part, PatchList):
+                    pending.append(iter(part.parts))
+                    break
+                yield from part
+            else:
+                pending.pop()
+
 
 class Command:
-    def __init__(self, opcode='', arg1='', arg2='', arg3=''):
+    """ one quad. Commands are slotted records without an instance dict, and the names they
+        hold are interned where they are created (the ast nodes, generate_temp_variable),
+        so every use of a variable shares one string.
+        lineno is the source line of the statement (or condition) the quad was generated for """
+    __slots__ = ('opcode', 'arg1', 'arg2', 'arg3', 'lineno')
+
+    def __init__(self, opcode='', arg1='', arg2='', arg3='', lineno=None):
         self.opcode = opcode
         self.arg1 = arg1
         self.arg2 = arg2
         self.arg3 = arg3
+        self.lineno = lineno
 
     def __repr__(self):
         return f"< {self.opcode} {self.arg1} {self.arg2} {self.arg3}>"
 
+    def __str__(self):
+        if self.arg3 != '':
+            return f"{self.opcode} {self.arg1} {self.arg2} {self.arg3}"
+        if self.arg2 != '':
+            return f"{self.opcode} {self.arg1} {self.arg2}"
+        if self.arg1 != '':
+            return f"{self.opcode} {self.arg1}"
+        return self.opcode
+
+
+# switches with at least this many case values test them with a binary search
+SWITCH_SEARCH_MIN = 8
+
+# a binary search ends with a linear test of at most this many case values
+SWITCH_SEARCH_LEAF = 3
+
 
 class Interpreter:
-    def __init__(self):
+    def __init__(self, diagnostics=None, switch_search_min=SWITCH_SEARCH_MIN):
+        self.diagnostics = diagnostics if diagnostics is not None else Diagnostics()
+        # 0 keeps every switch on the linear case tests
+        self.switch_search_min = switch_search_min
+        self.reset()
+
+    def reset(self):
+        """ clears the state of the previous compile """
         self.commands = []
         self.switch_names = '$0' , '$1'
         self.labels = {}
@@ -44,7 +115,7 @@ class Interpreter:
 
     def assign_type(self, typing):
         """ adds the type of the variables into the table"""
-        for var in reversed(list(self.table.keys())):
+        for var in reversed(self.table):
             if self.table[var] == '':
                 self.table[var] = typing
             else:
@@ -65,18 +136,29 @@ class Interpreter:
 
     def generate_temp_variable(self):
         """ generates t values starts from 2 """
-        temp_name = f't{self.count+1}'
+        temp_name = sys.intern(f't{self.count+1}')
         self.count += 1
         return temp_name
 
 
-    def compile_commands(self):
-        compiled = []
+    def resolve_commands(self):
+        """ replaces the labels of the jumps with their target lines """
         for command in self.commands:
             if command.opcode in ('JMPZ', 'JUMP'):
                 command.arg1 = self.labels.get(command.arg1, command.arg1)
-            compiled.append(f"{command.opcode} {command.arg1} {command.arg2} {command.arg3}")
-        return compiled
+        return self.commands
+
+    def compile_commands(self):
+        """ yields the resolved commands as quad lines, one at a time """
+        for command in self.resolve_commands():
+            yield str(command)
+
+    def mark_source_line(self, first, lineno):
+        """ gives the commands from index first on that have no source line yet the line lineno,
+            inner statements mark their commands first, so every quad keeps the innermost line """
+        for command in self.commands[first:]:
+            if command.lineno is None:
+                command.lineno = lineno
 
     def current_line(self):
         """ returns the current line """
@@ -101,14 +183,64 @@ class Interpreter:
         """ interpreters the case within the switch by doing the check with the switch stmt and the case value,
         with IEQL to check if equal , and JMPZ to exit if not equal"""
         if self.get_type(var) != 'int':
-            print(f"error at line {lineno}, illegal type 'float' in case, variable='{var}'")
-            Success.found_errors = 1
+            self.diagnostics.report(f"error at line {lineno}, illegal type 'float' in case, variable='{var}'")
         pair = self.switch_names
         self.commands.append(Command('IEQL', pair[0], pair[1], var))
         case_label = self.assign_label(self.current_line())
         self.commands.append(Command('JMPZ', case_label, pair[0]))
         return case_label
 
+    def use_switch_search(self, case_count):
+        """ whether the cases of a switch are tested with a binary search """
+        return 0 < self.switch_search_min <= case_count
+
+    def start_switch_search(self, cases):
+        """ tests the case values of a switch with a binary search over the sorted values,
+            ILSS splits the values in halves and the last few are tested one by one with INQL.
+            cases are (value, lineno) pairs, a repeated value goes to its first case like it
+            does with the linear tests. returns the jump labels of every value and of the default """
+        pair = self.switch_names
+        first_case = {}
+        for var, lineno in cases:
+            if self.get_type(var) != 'int':
+                self.diagnostics.report(f"error at line {lineno}, illegal type 'float' in case, variable='{var}'")
+                continue
+            first_case.setdefault(int(var), var)
+        values = sorted(first_case)
+        case_labels = {value: [] for value in values}
+        default_labels = []
+
+        def search(low, high):
+            if high - low <= SWITCH_SEARCH_LEAF:
+                for value in values[low:high]:
+                    self.commands.append(Command('INQL', pair[0], pair[1], first_case[value]))
+                    case_labels[value].append(self.assign_label(self.current_line()))
+                    self.commands.append(Command('JMPZ', case_labels[value][-1], pair[0]))
+                default_labels.append(self.assign_label(self.current_line()))
+                self.commands.append(Command('JUMP', default_labels[-1]))
+                return
+            middle = (low + high) // 2
+            self.commands.append(Command('ILSS', pair[0], pair[1], first_case[values[middle]]))
+            upper_label = self.assign_label(self.current_line())
+            self.commands.append(Command('JMPZ', upper_label, pair[0]))
+            search(low, middle)
+            self.back_patching([upper_label], self.current_line())
+            search(middle, high)
+
+        search(0, len(values))
+        return case_labels, default_labels
+
+    def start_case_arm(self, case_labels, var):
+        """ starts the statements of a case tested by the binary search """
+        if self.get_type(var) == 'int':
+            self.back_patching(case_labels.pop(int(var), []), self.current_line())
+
+    def end_case_arm(self):
+        """ ends a case arm with a jump out of the switch, returns its label """
+        exit_label = self.assign_label(self.current_line())
+        self.commands.append(Command('JUMP', exit_label))
+        return exit_label
+
     def start_while(self):
         """ starting the while interpretation """
         self.add_nest()
@@ -120,18 +252,18 @@ class Interpreter:
          """
         self.add_nest()
         if self.get_type(var) != 'int':
-            print(f"error at line {lineno} illegal type 'float' in case, variable='{var}'")
-            Success.found_errors = 1
+            self.diagnostics.report(f"error at line {lineno} illegal type 'float' in case, variable='{var}'")
         pair = self.switch_names
         self.commands.append(Command('IASN', pair[1], var))
 
     def assign_label(self, lineno):
-        """ assign labels for the lines """
-        self.labels[lineno] = lineno
+        """ assign labels for the lines, an unpatched label resolves to itself,
+            so labels only holds the labels that were patched """
+        self.labels.pop(lineno, None)
         return lineno
 
     def back_patching(self, label_list, target):
-        """ backpatching for the labels """
+        """ backpatching for the labels, label_list is a list of labels or a PatchList """
         for label in label_list:
             self.labels[label] = target
 
@@ -140,7 +272,8 @@ class Interpreter:
         original_type = self.get_type(var)
         target_type = 'float' if 'float' in cast_type else 'int'
         if original_type == target_type:
-            print(f"error at line {lineno}, casting from '{target_type}' to '{original_type}', variable='{var}'")
+            self.diagnostics.report(f"error at line {lineno}, casting from '{target_type}' to '{original_type}', variable='{var}'",
+                                    error=False)
         result_var = self.generate_temp_variable()
         opcode = 'ITOR' if target_type == 'float' else 'RTOI'
         self.commands.append(Command(opcode, result_var, var))
@@ -159,8 +292,7 @@ class Interpreter:
             self.table[target] = source_type
 
         if self.get_type(target) == 'int' and self.get_type(source) == 'float':
-            print(f"error at line {lineno}, can't assign 'float' to 'int'")
-            Success.found_errors = 1
+            self.diagnostics.report(f"error at line {lineno}, can't assign 'float' to 'int'")
         opcode = 'RASN' if target_type == 'float' else 'IASN'
         self.commands.append(Command(opcode, target, source))
         return []
@@ -182,7 +314,7 @@ class Interpreter:
         self.commands.append(Command(opcodes[operator][type_index], result, left_var, right_var))
         return result
 
-    def handle_relop(self, jump_line, operator, left_var, right_var, lineno):
+    def handle_relop(self, operator, left_var, right_var, lineno):
         """ handles relop operation , checks if the value of the operation should be float
                 then appends the right command into the Command struct"""
         var1, var2, result_type = self.handle_numeric(left_var, right_var, lineno)
@@ -199,9 +331,10 @@ class Interpreter:
         self.commands.append(Command(opcodes[operator][type_index], result, var1, var2))
         if operator in ('>=', '<='):
             self.commands.append(Command('ISUB', result, '1', result))
-        self.commands.append(Command('JMPZ', jump_line, result))
-        true_label = self.assign_label(self.current_line())
-        return [[true_label], [jump_line]]
+        false_label = self.assign_label(self.current_line())
+        self.commands.append(Command('JMPZ', false_label, result))
+        # the true exit falls through, it has no label until create_true_jump makes one
+        return [[], [false_label]]
 
     def handle_output(self, var, lineno):
         """Outputs a variable or a number, checking if a variable has been declared."""
@@ -221,8 +354,7 @@ class Interpreter:
 
         # If not a number, check if it's a declared variable
         if not self.in_table(var):
-            print(f"error at line {lineno}, undeclared variable {var}")
-            Success.found_errors = 1
+            self.diagnostics.report(f"error at line {lineno}, undeclared variable {var}")
             return []
 
         # Get the correct opcode based on variable type
@@ -253,10 +385,9 @@ class Interpreter:
         return new_var1, new_var2, result_type
 
     def load_variable(self, var, lineno):
-        """ loads variable if already loaded prints error """
+        """ loads variable if already loaded reports an error """
         if not self.load(var):
-            print(f"error at line {lineno}, multiple declarations of {var}")
-            Success.found_errors = 1
+            self.diagnostics.report(f"error at line {lineno}, multiple declarations of {var}")
 
     def declare_variables(self, type_spec):
         """ assign variables their declared type. """
@@ -264,30 +395,37 @@ class Interpreter:
 
     def check_variable(self, var, lineno):
         if not self.in_table(var):
-            print(f"error at line {lineno}, undeclared variable '{var}'")
-            Success.found_errors = 1
+            self.diagnostics.report(f"error at line {lineno}, undeclared variable '{var}'")
 
     def handle_booleanExpression(self, jump_line, operator, left_expr, right_expr, lineno):
         """ handles boolean expressions and/or interpretation """
         if operator == '&&':
             self.back_patching(left_expr[0], jump_line)
             true_list = right_expr[0]
-            false_list = left_expr[1] + right_expr[1]
+            false_list = PatchList.join(left_expr[1], right_expr[1])
         elif operator == '||':
             self.back_patching(left_expr[1], jump_line)
-            true_list = left_expr[0] + right_expr[0]
+            true_list = PatchList.join(left_expr[0], right_expr[0])
             false_list = right_expr[1]
         else:
             true_list = false_list = []
         return [true_list, false_list]
 
+    def create_true_jump(self, boolean_expr):
+        """ creates a JUMP for the true exit of a boolean expression, which falls through to the
+            next line, so it can be patched like its other exits """
+        true_label = self.assign_label(self.current_line())
+        self.commands.append(Command('JUMP', true_label))
+        return [PatchList.join(boolean_expr[0], [true_label]), boolean_expr[1]]
+
     def handle_notExpression(self, boolean_expr):
-        """ handles not expression """
-        return [boolean_expr[1], boolean_expr[0]]
+        """ handles not expression, the true exit that falls through becomes a jump to the false target """
+        true_list, false_list = self.create_true_jump(boolean_expr)
+        return [false_list, true_list]
 
     def handle_Program(self, entry_labels, halt_line):
         self.back_patching(entry_labels, halt_line)
-        return self.compile_commands()
+        return self.resolve_commands()
 
     def handle_statementList(self, first_list, second_list, statement_line):
         self.back_patching(first_list, statement_line)
@@ -296,7 +434,7 @@ class Interpreter:
     def handle_ifStatement(self, bool_expr, true_line, else_line, false_line, true_stmt, false_stmt):
         self.back_patching(bool_expr[0], true_line)
         self.back_patching(bool_expr[1], false_line)
-        return true_stmt + false_stmt + [else_line]
+        return PatchList.join(true_stmt, false_stmt, [else_line])
 
     def handle_whileStatement(self, bool_expr, while_start, stmt_line, stmt_body):
         self.back_patching(stmt_body, while_start)
@@ -311,7 +449,7 @@ class Interpreter:
         self.back_patching([else_label], next_line + 1)
         true_label = self.assign_label(self.current_line())
         self.commands.append(Command('JUMP', true_label))
-        exits = case_list + [true_label]
+        exits = PatchList.join(case_list, [true_label])
         return exits
 
     def handle_switchStatement(self, case_list, next_line):
@@ -321,6 +459,5 @@ class Interpreter:
 
     def handle_breakStatement(self, lineno):
         if not self.in_nest():
-            print("error at line %s, illegal 'break;' out of if/while scope" % (lineno))
-            Success.found_errors = 1
+            self.diagnostics.report("error at line %s, illegal 'break;' out of if/while scope" % (lineno))
         return []
@@ -1,7 +1,10 @@
 """ Lexer Class - Defines the CPL Language
     This class is implemented using the SLY package
     """
+import re
 from sly import Lexer
+from interpreter import Diagnostics
+import tablecache
 
 class LexerCPQ(Lexer):
     tokens = {ID, NUM,INPUT, OUTPUT,IF, ELSE, SWITCH, CASE, DEFAULT,WHILE, BREAK,INT, FLOAT, CAST,RELOP, ADDOP, MULOP, OR, AND, NOT}
@@ -9,6 +12,9 @@ class LexerCPQ(Lexer):
     ignore_comment = r'/\*([^*]|[\r\n]|(\*+([^*/]|[\r\n])))*\*+/'
     ignore = ' \t'
 
+    def __init__(self, diagnostics=None):
+        self.diagnostics = diagnostics if diagnostics is not None else Diagnostics()
+
     @_(r'(\d*\.\d+)|(\d+\.\d*)',r'[0-9]+')
     def NUM(self, t):
         return t
@@ -72,6 +78,28 @@ class LexerCPQ(Lexer):
 
 
     def error(self, t):
-        print("Lexical error at line %s, symbol='%s'" % (self.lineno, t.value[0]))
+        self.diagnostics.report("Lexical error at line %s, symbol='%s'" % (self.lineno, t.value[0]), error=False)
         self.index += 1
 
+    def tokenize_chunks(self, chunks):
+        """ tokenizes a source that arrives in chunks, line numbers carry on from chunk to chunk.
+            no token may span two chunks """
+        lineno = 1
+        for chunk in chunks:
+            yield from self.tokenize(chunk, lineno)
+            lineno = self.lineno
+
+    @classmethod
+    def _build(cls):
+        """ builds the lexer through sly, reusing the master regex of the table cache """
+        key = tablecache.lexer_key(cls)
+        master = tablecache.load(key)
+        if isinstance(master, str):
+            cls.regex_module = tablecache.CachedRegex(master)
+        try:
+            super()._build()
+        finally:
+            cls.regex_module = re
+        if master != cls._master_re.pattern:
+            tablecache.save(key, cls._master_re.pattern)
+
@@ -0,0 +1,79 @@
+""" MappedSource - a source file that is memory mapped instead of read into memory
+    the source is handed to the lexer in chunks that end on a line break, so peak memory
+    does not grow with the size of the file
+"""
+import locale
+import mmap
+
+WHITESPACE = b' \t\r\n\v\f'
+
+# the size of the chunks the source is lexed in
+CHUNK_SIZE = 1024 * 1024
+
+
+class MappedSource:
+    """ a memory mapped source file, start and end skip the surrounding whitespace
+        the same way reading the whole file and strip()ing it does """
+    def __init__(self, filename):
+        self.encoding = locale.getpreferredencoding(False)
+        with open(filename, "rb") as file:
+            try:
+                self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # an empty file can't be mapped
+                self.map = b''
+        self.start = 0
+        self.end = len(self.map)
+        while self.start < self.end and self.map[self.start] in WHITESPACE:
+            self.start += 1
+        while self.end > self.start and self.map[self.end - 1] in WHITESPACE:
+            self.end -= 1
+
+    def empty(self):
+        return self.start == self.end
+
+    def view(self):
+        """ the source without its surrounding whitespace, without copying it """
+        return memoryview(self.map)[self.start:self.end]
+
+    def chunks(self, chunk_size=None):
+        """ yields the source as text chunks of about chunk_size bytes (default CHUNK_SIZE).
+            a chunk is cut after a line break, and never inside a comment, so no token
+            spans two chunks """
+        chunk_size = chunk_size or CHUNK_SIZE
+        position = self.start
+        while position < self.end:
+            cut = self.end
+            if position + chunk_size < self.end:
+                cut = self.map.rfind(b'\n', position, position + chunk_size) + 1
+                if cut <= position:
+                    cut = self.line_end(position + chunk_size)
+                cut = self.comment_end(position, cut)
+            # universal newlines, like a file read in text mode
+            yield self.map[position:cut].decode(self.encoding).replace('\r\n', '\n').replace('\r', '\n')
+            position = cut
+
+    def comment_end(self, position, cut):
+        """ the cut, or the end of the line where the comment open at the cut is closed.
+            the chunk is scanned from position the way the lexer matches comments, a comment
+            runs from /* to the first */ after it, and a /* that is never closed is no comment
+            (it is lexed as tokens), so no comment follows it """
+        opened = self.map.find(b'/*', position, cut)
+        while opened >= 0:
+            closed = self.map.find(b'*/', opened + 2, self.end)
+            if closed < 0:
+                return cut
+            if closed + 2 > cut:
+                # another comment may open on the line the cut moves to
+                cut = self.line_end(closed + 2)
+            opened = self.map.find(b'/*', closed + 2, cut)
+        return cut
+
+    def line_end(self, position):
+        """ the position right after the line break that ends the line of position """
+        found = self.map.find(b'\n', position, self.end)
+        return self.end if found < 0 else found + 1
+
+    def close(self):
+        if isinstance(self.map, mmap.mmap):
+            self.map.close()
@@ -0,0 +1,701 @@
+""" Optimizer - optimization passes over the generated quads
+    the passes work on resolved Command objects, where the target of a JUMP/JMPZ
+    is the (1 based) line number it jumps to
+"""
+import heapq
+import math
+import operator
+import re
+import sys
+from quadvm import NUMBER, int_division
+from cfg import BasicBlock, ControlFlowGraph
+
+JUMPS = ('JMPZ', 'JUMP')
+
+# how the Quad machine computes every operation, the constant folding evaluates them the same way
+OPERATIONS = {
+    'IADD': operator.add, 'ISUB': operator.sub, 'IMLT': operator.mul, 'IDIV': int_division,
+    'RADD': operator.add, 'RSUB': operator.sub, 'RMLT': operator.mul, 'RDIV': operator.truediv,
+    'ILSS': lambda left, right: 1 if left < right else 0,
+    'IGRT': lambda left, right: 1 if left > right else 0,
+    'IEQL': lambda left, right: 1 if left == right else 0,
+    'INQL': lambda left, right: 1 if left != right else 0,
+    'RLSS': lambda left, right: 1 if left < right else 0,
+    'RGRT': lambda left, right: 1 if left > right else 0,
+    'REQL': lambda left, right: 1 if left == right else 0,
+    'RNQL': lambda left, right: 1 if left != right else 0,
+    'ITOR': float, 'RTOI': int,
+}
+
+# the opcodes that only copy their operand
+COPIES = ('IASN', 'RASN')
+
+# the opcodes whose result is a real, a folded one becomes an RASN, all the others an IASN
+REAL_RESULTS = ('RADD', 'RSUB', 'RMLT', 'RDIV', 'ITOR')
+
+# the operations whose operands can be swapped, their value numbers ignore the operand order
+COMMUTATIVE = frozenset(('IADD', 'IMLT', 'RADD', 'RMLT', 'IEQL', 'INQL', 'REQL', 'RNQL'))
+
+# the opcodes that store into their first operand
+STORES = frozenset(tuple(OPERATIONS) + COPIES + ('IINP', 'RINP'))
+
+# the names generate_temp_variable hands out
+TEMP_NAME = re.compile(r't[0-9]+')
+
+
+def operands(command):
+    """ returns the variables a command reads and the variable it writes (or None) """
+    opcode = command.opcode
+    if opcode in STORES:
+        arg2, arg3 = command.arg2, command.arg3
+        if arg3 == '':
+            return [arg2] if isinstance(arg2, str) else [], command.arg1
+        return [arg for arg in (arg2, arg3) if isinstance(arg, str)], command.arg1
+    if opcode in ('IPRT', 'RPRT'):
+        return [command.arg1] if isinstance(command.arg1, str) else [], None
+    if opcode == 'JMPZ':
+        return [command.arg2] if isinstance(command.arg2, str) else [], None
+    return [], None
+
+
+def removable(command):
+    """ whether a store can be dropped when its value is never read, input is always kept,
+        a division only when its divisor is a constant other than zero and a conversion only
+        when its operand is a constant it converts (int of an infinite real and float of a
+        huge int fault) """
+    if command.opcode in ('IINP', 'RINP'):
+        return False
+    if command.opcode in ('IDIV', 'RDIV'):
+        return bool(constant_value(command.arg3))
+    if command.opcode in ('ITOR', 'RTOI'):
+        value = constant_value(command.arg2)
+        if value is None:
+            return False
+        try:
+            float(value) if command.opcode == 'ITOR' else int(value)
+        except (ArithmeticError, ValueError):
+            return False
+    return True
+
+
+def block_sets(block):
+    """ the variables a block reads before writing them, and the variables it writes """
+    use = set()
+    define = set()
+    for command in reversed(block.commands):
+        reads, write = operands(command)
+        if write is not None:
+            define.add(write)
+            use.discard(write)
+        use.update(reads)
+    return use, define
+
+
+def hoistable(command):
+    """ whether a command may run in a loop preheader even when the loop runs zero times,
+        what can be dropped can run once more: a division only when its divisor is a constant
+        other than zero, a conversion (RTOI or ITOR) only of a constant it converts """
+    return command.opcode in STORES and removable(command)
+
+
+def bit_mask(names, numbering):
+    """ the bit mask of the names that are numbered """
+    mask = 0
+    for name in names:
+        if name in numbering:
+            mask |= 1 << numbering[name]
+    return mask
+
+
+def solve_liveness(graph, uses, defs):
+    """ iterates the live in and out bit masks of the blocks to their fixed point """
+    successors = [[successor.index for successor in block.successors] for block in graph.blocks]
+    live_in = [0] * len(graph.blocks)
+    live_out = [0] * len(graph.blocks)
+    changed = True
+    while changed:
+        changed = False
+        for index in range(len(graph.blocks) - 1, -1, -1):
+            out = 0
+            for successor in successors[index]:
+                out |= live_in[successor]
+            live = uses[index] | (out & ~defs[index])
+            if out != live_out[index] or live != live_in[index]:
+                live_out[index], live_in[index] = out, live
+                changed = True
+    return live_in, live_out
+
+
+def liveness(graph, candidates):
+    """ the variables live into and out of every block of the graph. only the candidates some
+        block reads before writing them can be live across blocks, so the sets only hold those.
+        returns their numbering (variable -> bit), the use and def bit masks of the blocks
+        and the live in and out bit masks """
+    sets = [block_sets(block) for block in graph.blocks]
+    numbering = {}
+    for use, _ in sets:
+        for name in use:
+            if name in candidates and name not in numbering:
+                numbering[name] = len(numbering)
+    uses = [bit_mask(use, numbering) for use, _ in sets]
+    defs = [bit_mask(define, numbering) for _, define in sets]
+    live_in, live_out = solve_liveness(graph, uses, defs)
+    return numbering, uses, defs, live_in, live_out
+
+
+def constant_value(operand):
+    """ the value of a literal operand, None for a variable. a literal whose value literal()
+        can't write back (a real too large to be finite, an int with too many digits) is left
+        to the machine like a variable """
+    if isinstance(operand, (int, float)):
+        return operand
+    match = NUMBER.fullmatch(operand)
+    if match is None:
+        return None
+    try:
+        if '.' in operand or match.group(2):
+            value = float(operand)
+            return value if math.isfinite(value) else None
+        return int(operand)
+    except ValueError:
+        return None
+
+
+def literal(value):
+    """ the operand text of a folded value, the Quad machine reads it back as the same value """
+    return sys.intern(repr(value))
+
+
+def relocate(commands, removed):
+    """ drops the removed commands and rewrites every jump target in one pass,
+        using a prefix sum that maps each old line to its new line """
+    size = len(commands)
+    remap = [0] * (size + 2)
+    new_line = 1
+    for line in range(1, size + 2):
+        remap[line] = new_line
+        if line <= size and not removed[line - 1]:
+            new_line += 1
+
+    # compacts the list in place instead of copying the kept commands into a new one
+    kept = 0
+    for command, drop in zip(commands, removed):
+        if drop:
+            continue
+        if command.opcode in JUMPS:
+            command.arg1 = remap[command.arg1]
+        commands[kept] = command
+        kept += 1
+    del commands[kept:]
+    return commands
+
+
+class Optimizer:
+    """ runs the optimization passes over a list of resolved commands,
+        stats counts what every pass changed """
+    # the passes in the order optimize runs them
+    PASSES = ('fold_constants', 'thread_jumps', 'number_values', 'eliminate_dead_code', 'hoist_invariants',
+              'remove_redundant_jumps', 'reuse_temps')
+
+    def __init__(self, declared=()):
+        # declared variables are never taken for temps, even when named like one
+        self.declared = declared
+        self.stats = {}
+
+    def optimize(self, commands):
+        for name in self.PASSES:
+            commands = getattr(self, name)(commands)
+        return commands
+
+    def fold_constants(self, commands):
+        """ propagates the constants assigned to variables inside a basic block, evaluates the
+            operations whose operands are all constant and replaces them with an assignment of
+            the result. a JMPZ on a constant becomes a JUMP, or is dropped when it never jumps.
+            operations that would fault at run time (division by zero) are left to the machine """
+        targets = set()
+        for command in commands:
+            if command.opcode in JUMPS:
+                targets.add(command.arg1)
+
+        folded = branches = 0
+        removed = [False] * len(commands)
+        known = {}
+        for line, command in enumerate(commands, start=1):
+            if line in targets:
+                known.clear()
+            opcode = command.opcode
+            if opcode in STORES:
+                sources = [command.arg2, command.arg3] if command.arg3 != '' else [command.arg2]
+                values = []
+                for position, source in enumerate(sources):
+                    value = constant_value(source)
+                    if value is None and source in known:
+                        value = known[source]
+                        setattr(command, 'arg3' if position else 'arg2', literal(value))
+                    values.append(value)
+                known.pop(command.arg1, None)
+                if opcode in ('IINP', 'RINP') or None in values:
+                    continue
+                if opcode in COPIES:
+                    known[command.arg1] = values[0]
+                    continue
+                try:
+                    value = OPERATIONS[opcode](*values)
+                    text = literal(value)
+                except (ArithmeticError, ValueError):
+                    continue
+                if isinstance(value, float) and not math.isfinite(value):
+                    continue
+                command.opcode = 'RASN' if opcode in REAL_RESULTS else 'IASN'
+                command.arg2, command.arg3 = text, ''
+                known[command.arg1] = value
+                folded += 1
+            elif opcode in ('IPRT', 'RPRT'):
+                if constant_value(command.arg1) is None and command.arg1 in known:
+                    command.arg1 = literal(known[command.arg1])
+            elif opcode == 'JMPZ':
+                value = constant_value(command.arg2)
+                if value is None:
+                    value = known.get(command.arg2)
+                if value is None:
+                    continue
+                if value:
+                    removed[line - 1] = True
+                else:
+                    command.opcode, command.arg2 = 'JUMP', ''
+                branches += 1
+
+        self.stats['folded_constants'] = folded
+        self.stats['folded_branches'] = branches
+        return relocate(commands, removed)
+
+    def thread_jumps(self, commands):
+        """ redirects every branch whose target is a JUMP to the end of the jump chain,
+            turns JUMPs that end on HALT into HALT and drops the JUMPs nobody reaches any more """
+        size = len(commands)
+        # final[line] - where a JUMP chain starting at line ends, -1 while the chain is being followed
+        final = [0] * (size + 2)
+
+        def destination(line):
+            path = []
+            while 1 <= line <= size and commands[line - 1].opcode == 'JUMP' and not final[line]:
+                final[line] = -1
+                path.append(line)
+                line = commands[line - 1].arg1
+            if 1 <= line <= size and final[line] > 0:
+                line = final[line]
+            for step in path:
+                final[step] = line
+            return line
+
+        threaded = 0
+        for command in commands:
+            if command.opcode in JUMPS:
+                target = destination(command.arg1)
+                if target != command.arg1:
+                    command.arg1 = target
+                    threaded += 1
+                if command.opcode == 'JUMP' and 1 <= target <= size and commands[target - 1].opcode == 'HALT':
+                    command.opcode, command.arg1 = 'HALT', ''
+
+        reachable = self.reachable_lines(commands)
+        removed = [command.opcode == 'JUMP' and not reachable[line]
+                   for line, command in enumerate(commands, start=1)]
+
+        self.stats['threaded_jumps'] = threaded
+        self.stats['unreachable_jumps'] = sum(removed)
+        return relocate(commands, removed)
+
+    def number_values(self, commands):
+        """ local value numbering. an operation that computes again a value some variable of the
+            basic block still holds becomes a copy of that variable, and the reads of the copy
+            further down the block read the variable itself, so the copy is left for the dead
+            code elimination. a store to a variable (an operation, IASN/RASN or IINP/RINP)
+            forgets the values computed from it and the values it held """
+        targets = set()
+        for command in commands:
+            if command.opcode in JUMPS:
+                targets.add(command.arg1)
+
+        reused = 0
+        removed = [False] * len(commands)
+        # (opcode, operand, operand) -> the variable holding the value, copy -> the variable it copies
+        values = {}
+        copies = {}
+        # the keys every variable is an operand of, the keys it holds and the copies made of it
+        readers = {}
+        held = {}
+        copied = {}
+        tables = (values, copies, readers, held, copied)
+
+        def forget(name):
+            for key in readers.pop(name, ()):
+                values.pop(key, None)
+            for key in held.pop(name, ()):
+                if values.get(key) == name:
+                    del values[key]
+            for copy in copied.pop(name, ()):
+                if copies.get(copy) == name:
+                    del copies[copy]
+            copies.pop(name, None)
+
+        for line, command in enumerate(commands, start=1):
+            if line in targets:
+                for table in tables:
+                    table.clear()
+            opcode = command.opcode
+            if opcode in STORES:
+                if command.arg2 in copies:
+                    command.arg2 = copies[command.arg2]
+                if command.arg3 in copies:
+                    command.arg3 = copies[command.arg3]
+            elif opcode in ('IPRT', 'RPRT'):
+                if command.arg1 in copies:
+                    command.arg1 = copies[command.arg1]
+                continue
+            elif opcode == 'JMPZ':
+                if command.arg2 in copies:
+                    command.arg2 = copies[command.arg2]
+                continue
+            else:
+                continue
+
+            target = command.arg1
+            if opcode not in OPERATIONS:
+                forget(target)
+                continue
+            left, right = command.arg2, command.arg3
+            if opcode in COMMUTATIVE and right < left:
+                left, right = right, left
+            key = (opcode, left, right)
+            holder = values.get(key)
+            if holder is not None:
+                reused += 1
+                if holder == target:
+                    removed[line - 1] = True
+                    continue
+                command.opcode = 'RASN' if opcode in REAL_RESULTS else 'IASN'
+                command.arg2, command.arg3 = holder, ''
+                forget(target)
+                copies[target] = holder
+                copied.setdefault(holder, []).append(target)
+                continue
+            forget(target)
+            if target != left and target != right:
+                values[key] = target
+                held.setdefault(target, []).append(key)
+                readers.setdefault(left, []).append(key)
+                if right != '':
+                    readers.setdefault(right, []).append(key)
+
+        self.stats['reused_values'] = reused
+        return relocate(commands, removed) if any(removed) else commands
+
+    def reachable_lines(self, commands):
+        """ marks the lines control can reach from the first line """
+        size = len(commands)
+        reachable = [False] * (size + 2)
+        pending = [1]
+        while pending:
+            line = pending.pop()
+            while 1 <= line <= size and not reachable[line]:
+                reachable[line] = True
+                command = commands[line - 1]
+                if command.opcode == 'HALT':
+                    break
+                if command.opcode == 'JUMP':
+                    line = command.arg1
+                    continue
+                if command.opcode == 'JMPZ':
+                    pending.append(command.arg1)
+                line += 1
+        return reachable
+
+    def eliminate_dead_code(self, commands):
+        """ removes the blocks control never reaches, then the stores whose value is never read.
+            input and output always stay, and so does a division that may fault at run time """
+        graph = ControlFlowGraph.build(commands)
+        unreachable = graph.remove_unreachable()
+        dead_stores = self.remove_dead_stores(graph)
+
+        self.stats['unreachable_code'] = unreachable
+        self.stats['dead_stores'] = dead_stores
+        self.stats['dead_code'] = unreachable + dead_stores
+        return graph.lower()
+
+    def remove_dead_stores(self, graph):
+        """ drops the dead stores of every block in a backward pass. a removed store may make
+            the stores feeding it in other blocks dead, so liveness is solved again and the
+            blocks whose live out set shrank are passed again, until nothing changes.
+            returns how many stores were dropped """
+        stored = set()
+        for block in graph.blocks:
+            for command in block.commands:
+                if command.opcode in STORES:
+                    stored.add(command.arg1)
+        # removing stores only takes reads away, so the first numbering stays a superset of what is live
+        numbering, uses, defs, live_in, live_out = liveness(graph, stored)
+
+        removed = 0
+        pending = graph.blocks
+        while pending:
+            changed = []
+            for block in pending:
+                kept = self.live_stores(block, live_out[block.index], numbering)
+                if len(kept) != len(block.commands):
+                    removed += len(block.commands) - len(kept)
+                    block.commands = kept
+                    changed.append(block)
+            if not changed:
+                break
+            for block in changed:
+                use, define = block_sets(block)
+                uses[block.index] = bit_mask(use, numbering)
+                defs[block.index] = bit_mask(define, numbering)
+            previous = live_out
+            live_in, live_out = solve_liveness(graph, uses, defs)
+            pending = [block for block in graph.blocks if live_out[block.index] != previous[block.index]]
+        return removed
+
+    def live_stores(self, block, live, numbering):
+        """ the commands of a block without its dead stores, live is the bit mask of the
+            numbered variables live out of the block """
+        # variables only used inside the block are tracked in a set
+        local = set()
+        kept = []
+        for command in reversed(block.commands):
+            reads, write = operands(command)
+            if write is not None:
+                if write in numbering:
+                    bit = 1 << numbering[write]
+                    used = live & bit
+                    live &= ~bit
+                else:
+                    used = write in local
+                    local.discard(write)
+                if not used and removable(command):
+                    continue
+            for name in reads:
+                if name in numbering:
+                    live |= 1 << numbering[name]
+                else:
+                    local.add(name)
+            kept.append(command)
+        kept.reverse()
+        return kept
+
+    def hoist_invariants(self, commands):
+        """ moves the loop invariant stores of every loop into a preheader, a block that runs
+            once before the loop header and that every entry into the loop passes. inner loops
+            go first, so what they hoist can move on out of the loops around them """
+        graph = ControlFlowGraph.build(commands)
+        loops = graph.loops()
+        if not loops:
+            self.stats['hoisted_invariants'] = 0
+            return commands
+
+        stored = set()
+        for loop in loops:
+            for block in loop.blocks:
+                for command in block.commands:
+                    if command.opcode in STORES:
+                        stored.add(command.arg1)
+        numbering, _, _, live_in, _ = liveness(graph, stored)
+        live_at = {block: live_in[block.index] for block in graph.blocks}
+        members = {loop: set(loop.blocks) for loop in loops}
+        # the loops around every loop header, a preheader joins them
+        headers = {loop.header: [] for loop in loops}
+        for loop in loops:
+            for block in loop.blocks:
+                if block in headers and block is not loop.header:
+                    headers[block].append(loop)
+
+        # a preheader stands in for its header in the liveness and dominator queries,
+        # the graph isn't analysed again after a preheader is added
+        hoisted = 0
+        preheaders = {}
+        for loop in reversed(loops):
+            moved = self.loop_invariants(graph, loop, members[loop], live_at, numbering)
+            if not moved:
+                continue
+            hoisted += len(moved)
+            preheader = self.add_preheader(loop, members[loop], moved)
+            preheaders[loop.header] = preheader
+            live_at[preheader] = live_at[loop.header]
+            preheader.first, preheader.last = loop.header.first, loop.header.last
+            for outer in headers[loop.header]:
+                members[outer].add(preheader)
+                outer.blocks.append(preheader)
+
+        self.stats['hoisted_invariants'] = hoisted
+        if not hoisted:
+            return commands
+        blocks = []
+        for block in graph.blocks:
+            if block in preheaders:
+                blocks.append(preheaders[block])
+            blocks.append(block)
+        for index, block in enumerate(blocks):
+            block.index = index
+        graph.blocks = blocks
+        return graph.lower()
+
+    def loop_invariants(self, graph, loop, blocks, live_at, numbering):
+        """ takes the invariant stores out of the blocks of a loop and returns them in an order
+            that computes every operand before it is read. a store is invariant when its operands
+            are constants or variables the loop doesn't store, and it can be hoisted when it is
+            the only store of its variable in the loop, the variable isn't live into the header
+            (no read in the loop sees an older value), and the store dominates every exit of
+            the loop or the variable is dead after it, so running it when the loop runs zero
+            times changes nothing """
+        stores = {}
+        for block in blocks:
+            for command in block.commands:
+                if command.opcode in STORES:
+                    stores[command.arg1] = stores.get(command.arg1, 0) + 1
+        exits = [(block, successor) for block in blocks for successor in block.successors if successor not in blocks]
+        header_live = live_at[loop.header]
+
+        def live(name, mask):
+            return name in numbering and mask >> numbering[name] & 1
+
+        moved = []
+        found = True
+        while found:
+            found = False
+            for block in loop.blocks:
+                kept = []
+                for command in block.commands:
+                    target = command.arg1
+                    if hoistable(command) and stores[target] == 1 and not live(target, header_live) \
+                            and all(stores.get(name, 0) == 0 for name in operands(command)[0]) \
+                            and all(not live(target, live_at[successor]) or graph.dominates(block, exit_block)
+                                    for exit_block, successor in exits):
+                        moved.append(command)
+                        stores[target] = 0
+                        found = True
+                    else:
+                        kept.append(command)
+                if len(kept) != len(block.commands):
+                    block.commands = kept
+        return moved
+
+    def add_preheader(self, loop, blocks, commands):
+        """ creates the preheader block of a loop holding commands, the edges that enter the
+            header from outside the loop are moved to it and it falls into the header """
+        header = loop.header
+        preheader = BasicBlock(-1, commands)
+        preheader.fall = header
+        preheader.successors = [header]
+        entering = [block for block in header.predecessors if block not in blocks]
+        for block in entering:
+            if block.target is header:
+                block.target = preheader
+            if block.fall is header:
+                block.fall = preheader
+            block.successors = [preheader if successor is header else successor for successor in block.successors]
+        preheader.predecessors = entering
+        header.predecessors = [block for block in header.predecessors if block in blocks] + [preheader]
+        return preheader
+
+    def remove_redundant_jumps(self, commands):
+        """ removes JUMPs and JMPZs to the line right after them, including jumps that only
+            become redundant once the jumps between them and their target are removed """
+        size = len(commands)
+        removed = [False] * size
+        # kept[line] - the first line at or after line that stays in the program
+        kept = list(range(size + 2))
+        for index in range(size - 1, -1, -1):
+            command = commands[index]
+            line = index + 1
+            if command.opcode in JUMPS and line < command.arg1 <= size + 1 \
+                    and kept[command.arg1] == kept[line + 1]:
+                removed[index] = True
+                kept[line] = kept[line + 1]
+
+        self.stats['redundant_jumps'] = sum(removed)
+        return relocate(commands, removed)
+
+    def reuse_temps(self, commands):
+        """ gives temps whose live ranges don't overlap the same name and numbers them densely.
+            a live range covers every line a temp is mentioned on, and every basic block it is
+            live into or out of. ints and reals take names from separate pools """
+        temps = {}
+        for command in commands:
+            reads, write = operands(command)
+            for name in reads + [write]:
+                if name not in temps and name is not None and name not in self.declared \
+                        and TEMP_NAME.fullmatch(name):
+                    temps[name] = len(temps)
+        if not temps:
+            self.stats['temps_before'] = 0
+            self.stats['temps'] = 0
+            return commands
+        names = list(temps)
+
+        graph = ControlFlowGraph.build(commands)
+        numbering, _, _, live_in, live_out = liveness(graph, temps)
+        exposed = [temps[name] for name in numbering]
+        bounds = []
+        line = 1
+        for block in graph.blocks:
+            bounds.append((line, line + len(block.commands) - 1))
+            line += len(block.commands)
+
+        # live ranges in positions, a line reads at 2 * line and writes at 2 * line + 1
+        start = [None] * len(names)
+        end = [None] * len(names)
+        real = [False] * len(names)
+
+        def extend(temp, position):
+            if start[temp] is None or position < start[temp]:
+                start[temp] = position
+            if end[temp] is None or position > end[temp]:
+                end[temp] = position
+
+        for index, (first, last) in enumerate(bounds):
+            live = live_in[index] | live_out[index]
+            while live:
+                bit = live & -live
+                live ^= bit
+                temp = exposed[bit.bit_length() - 1]
+                extend(temp, 2 * first)
+                extend(temp, 2 * last + 1)
+        for line, command in enumerate(commands, start=1):
+            reads, write = operands(command)
+            for name in reads:
+                if name in temps:
+                    extend(temps[name], 2 * line)
+            if write in temps:
+                extend(temps[write], 2 * line + 1)
+                if command.opcode in REAL_RESULTS or command.opcode in ('RASN', 'RINP'):
+                    real[temps[write]] = True
+
+        # linear scan, a name is free again once the range holding it has ended
+        renamed = {}
+        free = {False: [], True: []}
+        active = []
+        count = 0
+        for temp in sorted(range(len(names)), key=start.__getitem__):
+            while active and active[0][0] < start[temp]:
+                _, name, is_real = heapq.heappop(active)
+                heapq.heappush(free[is_real], name)
+            pool = free[real[temp]]
+            if pool:
+                name = heapq.heappop(pool)
+            else:
+                count += 1
+                while f"t{count}" in self.declared:
+                    count += 1
+                name = (count, f"t{count}")
+            renamed[names[temp]] = name[1]
+            heapq.heappush(active, (end[temp], name, real[temp]))
+
+        for command in commands:
+            for field in ('arg1', 'arg2', 'arg3'):
+                value = getattr(command, field)
+                if value in renamed and not (field == 'arg1' and command.opcode in JUMPS):
+                    setattr(command, field, renamed[value])
+        self.stats['temps_before'] = len(names)
+        self.stats['temps'] = len({name for name in renamed.values()})
+        return commands
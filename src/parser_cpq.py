@@ -3,15 +3,49 @@
 """
 import sys
 from sly import Parser
+from sly.yacc import YaccError
 from lexer_cpq import LexerCPQ
 from ast_cpq import *
+from interpreter import Diagnostics
+import tablecache
+
+
+# the private steps of the sly Parser build that the table cache runs itself, they are
+# name mangled internals of sly 0.5 (pinned in requirements.txt)
+SLY_BUILD_STEPS = ('_Parser__validate_specification', '_Parser__build_grammar', '_Parser__build_lrtables')
+
+
+def has_build_steps():
+    """ whether the installed sly has the build steps. the class body calls this function, an
+        upper case name read there is taken by sly for a token name """
+    return all(hasattr(Parser, step) for step in SLY_BUILD_STEPS)
 
 
 class ParserCPQ(Parser):
     tokens = LexerCPQ.tokens
 
-    def __init__(self):
-        pass
+    def __init__(self, diagnostics=None):
+        self.diagnostics = diagnostics if diagnostics is not None else Diagnostics()
+
+    # another sly version without these steps builds the parser the normal way, without the cache
+    if has_build_steps():
+        @classmethod
+        def _build(cls, definitions):
+            """ builds the grammar like sly does, but takes the LALR tables from the
+                table cache while the grammar is unchanged """
+            rules = [(name, value) for name, value in definitions if callable(value) and hasattr(value, 'rules')]
+            if not cls._Parser__validate_specification():
+                raise YaccError('Invalid parser specification')
+            cls._Parser__build_grammar(rules)
+
+            key = tablecache.grammar_key(cls._grammar)
+            entry = tablecache.load(key)
+            if entry is not None:
+                cls._lrtable = tablecache.ParseTables(*entry)
+                return
+            cls._Parser__build_lrtables()
+            tablecache.save(key, tablecache.ParseTables(cls._lrtable.lr_action, cls._lrtable.lr_goto,
+                                                        cls._lrtable.defaulted_states).to_entry())
 
 #Grammer for the programming language CPL#
     @_('declarations stmt_block')
@@ -53,7 +87,7 @@ class ParserCPQ(Parser):
 
     @_('INPUT "(" ID ")" ";"')
     def input_stmt(self, p):
-        return InputNode(IdfactorNode(p.ID, p.lineno))
+        return InputNode(IdfactorNode(p.ID, p.lineno), p.lineno)
 
     @_('OUTPUT "(" expression ")" ";"')
     def output_stmt(self, p):
@@ -160,8 +194,7 @@ class ParserCPQ(Parser):
         return EpsilonNode()
 
     def error(self, p):
-        print("Syntax error at line %s, token='%s'" % (p.lineno, p.type))
-        Success.found_errors = 1
+        self.diagnostics.report("Syntax error at line %s, token='%s'" % (p.lineno, p.type))
         errors = []
         while True:
 
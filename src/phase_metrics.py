@@ -0,0 +1,120 @@
+""" PhaseMetrics - measures the phases of a compile
+    every phase (lex, parse, gen, optimize, write) records its wall time, the memory it
+    allocated and what it produced (tokens, tree nodes, quads). a service that embeds the
+    compiler passes listeners, they are called with every phase as soon as it ends
+"""
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+class PhaseRecord:
+    """ the measurements of one phase.
+        start, seconds - when the phase started (perf_counter) and how long it took
+        allocated      - bytes still allocated at the end of the phase that it allocated, None without memory tracing
+        peak           - the most bytes the phase had allocated at any time, None without memory tracing
+        counts         - what the phase produced, like {'tokens': 1200}
+    """
+    __slots__ = ('name', 'start', 'seconds', 'allocated', 'peak', 'counts')
+
+    def __init__(self, name, start):
+        self.name = name
+        self.start = start
+        self.seconds = 0.0
+        self.allocated = None
+        self.peak = None
+        self.counts = {}
+
+    def as_dict(self):
+        return {'name': self.name, 'seconds': self.seconds, 'allocated': self.allocated, 'peak': self.peak,
+                'counts': dict(self.counts)}
+
+
+class PhaseMetrics:
+    """ collects the phases of one compile.
+        trace_memory - measure allocations with tracemalloc, which slows the compile down a lot
+        listeners    - callables called with every PhaseRecord when its phase ends """
+    def __init__(self, trace_memory=False, listeners=()):
+        self.trace_memory = trace_memory
+        self.listeners = list(listeners)
+        self.phases = []
+        self.origin = time.perf_counter()
+        self._started_tracing = False
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    @contextmanager
+    def phase(self, name):
+        """ measures the code run inside the with block as the phase name, yields its PhaseRecord
+            so the block can add its counts """
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        record = PhaseRecord(name, time.perf_counter())
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+        try:
+            yield record
+        finally:
+            record.seconds = time.perf_counter() - record.start
+            if self.trace_memory:
+                current, peak = tracemalloc.get_traced_memory()
+                record.allocated = current - before
+                record.peak = peak - before
+            self.phases.append(record)
+            for listener in self.listeners:
+                listener(record)
+
+    def stop(self):
+        """ stops the memory tracing this collector started """
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def total_seconds(self):
+        return sum(record.seconds for record in self.phases)
+
+    def as_dict(self):
+        return {'phases': [record.as_dict() for record in self.phases], 'seconds': self.total_seconds()}
+
+    def report(self):
+        """ the phases as table lines """
+        lines = [f"{'phase':<10}{'time':>10}{'allocated':>14}{'peak':>14}  counts"]
+        for record in self.phases:
+            counts = ", ".join(f"{name}={count}" for name, count in record.counts.items())
+            lines.append(f"{record.name:<10}{record.seconds:>9.3f}s{format_bytes(record.allocated):>14}"
+                         f"{format_bytes(record.peak):>14}  {counts}")
+        lines.append(f"{'total':<10}{self.total_seconds():>9.3f}s")
+        return lines
+
+    def trace_events(self):
+        """ the phases in the trace event format, the JSON can be opened in chrome://tracing or Perfetto """
+        events = []
+        for record in self.phases:
+            args = dict(record.counts)
+            if record.allocated is not None:
+                args['allocated'] = record.allocated
+                args['peak'] = record.peak
+            events.append({'name': record.name, 'cat': 'compile', 'ph': 'X', 'pid': os.getpid(),
+                           'tid': threading.get_ident(), 'ts': (record.start - self.origin) * 1e6,
+                           'dur': record.seconds * 1e6, 'args': args})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write_trace(self, filename):
+        with open(filename, 'w') as file:
+            json.dump(self.trace_events(), file, indent=1)
+
+
+def format_bytes(size):
+    if size is None:
+        return '-'
+    for unit in ('B', 'KB', 'MB'):
+        if abs(size) < 1024:
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
@@ -0,0 +1,267 @@
+""" QuadAOT - runs Quad programs translated ahead of time into Python
+    a decoded QuadProgram is translated into the source of one Python function, every memory slot
+    is a local variable of the function and the literals nobody writes are inlined as constants.
+    the code is cut into runs that start at jump targets, a dispatch loop picks the run to execute
+    with a binary search over the run numbers, and a run that jumps back to its own start (the
+    body of a while loop) loops in place without going through the dispatch.
+    the function is compiled once with compile() and cached by the hash of the program, in memory
+    and on disk. it produces the same output and the same errors as QuadVM
+"""
+import hashlib
+import marshal
+import os
+import sys
+from collections import OrderedDict
+from tablecache import default_cache_dir
+from quadvm import (QuadError, QuadProgram, QuadVM, fault_message, int_division, JMPZ, JUMP, IASN, IADD, ISUB, ILSS, IGRT,
+                    IEQL, INQL, IMLT, IDIV, ITOR, RTOI, RASN, RADD, RSUB, RLSS, RGRT, REQL, RNQL, RMLT, RDIV,
+                    IPRT, RPRT, IINP, RINP)
+
+# bump when the translation changes, it is part of the cache key
+TRANSLATOR_VERSION = 1
+
+# compiled programs kept in memory
+MEMORY_CACHE_SIZE = 32
+
+# the file name the generated code is compiled under, division faults are traced back through it
+CODE_NAME = '<quad program>'
+
+BINARY = {
+    IADD: '{b} + {c}', ISUB: '{b} - {c}', IMLT: '{b} * {c}', IDIV: 'int_division({b}, {c})',
+    RADD: '{b} + {c}', RSUB: '{b} - {c}', RMLT: '{b} * {c}', RDIV: '{b} / {c}',
+    ILSS: '1 if {b} < {c} else 0', IGRT: '1 if {b} > {c} else 0',
+    IEQL: '1 if {b} == {c} else 0', INQL: '1 if {b} != {c} else 0',
+    RLSS: '1 if {b} < {c} else 0', RGRT: '1 if {b} > {c} else 0',
+    REQL: '1 if {b} == {c} else 0', RNQL: '1 if {b} != {c} else 0',
+}
+
+UNARY = {IASN: '{b}', RASN: '{b}', ITOR: 'float({b})', RTOI: 'int({b})'}
+
+# the tests of the comparisons, a comparison followed by a JMPZ on its result becomes a Python if
+TESTS = {ILSS: '<', IGRT: '>', IEQL: '==', INQL: '!=', RLSS: '<', RGRT: '>', REQL: '==', RNQL: '!='}
+
+WRITES = set(BINARY) | set(UNARY) | {IINP, RINP}
+
+_compiled = OrderedDict()
+
+
+class Translation:
+    """ the Python source of a program, and the quad line of every source line that runs an instruction """
+    def __init__(self, program):
+        self.program = program
+        self.lines = []
+        self.quad_lines = {}
+        variables = set(program.symbols.values())
+        written = {a for op, a, b, c in program.code if op in WRITES}
+        self.locals = {slot for slot in range(len(program.memory))
+                       if slot in variables or slot in written or not is_constant(program.memory[slot])}
+        self.translate()
+
+    def operand(self, slot):
+        if slot in self.locals:
+            return f"v{slot}"
+        return repr(self.program.memory[slot])
+
+    def emit(self, depth, text, quad_line=None):
+        self.lines.append("    " * depth + text)
+        if quad_line is not None:
+            self.quad_lines[len(self.lines)] = quad_line
+
+    def translate(self):
+        code = self.program.code
+        leaders = sorted({0} | {a for op, a, b, c in code if op in (JUMP, JMPZ)})
+        self.run_of = {start: number for number, start in enumerate(leaders)}
+        self.runs = [(start, leaders[number + 1] if number + 1 < len(leaders) else len(code))
+                     for number, start in enumerate(leaders)]
+
+        self.emit(0, "def quad_program(memory, read, write, int_division):")
+        slots = sorted(self.locals)
+        if slots:
+            self.emit(1, f"{', '.join(f'v{slot}' for slot in slots)}, = "
+                         f"{', '.join(f'memory[{slot}]' for slot in slots)},")
+        self.result = f"return [{', '.join(self.operand(slot) for slot in range(len(self.program.memory)))}]"
+        self.emit(1, "run = 0")
+        self.emit(1, "while True:")
+        self.dispatch(0, len(self.runs), 2)
+
+    def dispatch(self, low, high, depth):
+        """ the runs low..high-1, picked with a binary search on the run number """
+        if high - low == 1:
+            self.body(low, depth)
+            return
+        middle = (low + high) // 2
+        self.emit(depth, f"if run < {middle}:")
+        self.dispatch(low, middle, depth + 1)
+        self.emit(depth, "else:")
+        self.dispatch(middle, high, depth + 1)
+
+    def body(self, number, depth):
+        start, end = self.runs[number]
+        code = self.program.code
+        looping = any(op in (JUMP, JMPZ) and a == start for op, a, b, c in code[start:end])
+        if looping:
+            self.emit(depth, "while True:")
+            depth += 1
+        index = start
+        while index < end:
+            op, a, b, c = code[index]
+            line = index + 1
+            index += 1
+            if op == JUMP or op == JMPZ:
+                if op == JUMP:
+                    self.emit(depth, self.jump(a, start, looping))
+                    break
+                self.emit(depth, f"if not {self.operand(b)}: {self.jump(a, start, looping)}", line)
+            elif op in TESTS and index < end and code[index][0] == JMPZ and code[index][2] == a:
+                # the result is still stored, a later instruction may read it
+                self.emit(depth, f"if {self.operand(b)} {TESTS[op]} {self.operand(c)}:", line)
+                self.emit(depth + 1, f"v{a} = 1")
+                self.emit(depth, "else:")
+                self.emit(depth + 1, f"v{a} = 0")
+                self.emit(depth + 1, self.jump(code[index][1], start, looping))
+                index += 1
+            elif op == IDIV and c not in self.locals and self.program.memory[c] > 0:
+                # truncating division by a positive constant without the call of int_division
+                dividend, divisor = self.operand(b), self.operand(c)
+                self.emit(depth, f"v{a} = {dividend} // {divisor} if {dividend} >= 0 else -(-{dividend} // {divisor})",
+                          line)
+            elif op in BINARY:
+                self.emit(depth, f"v{a} = {BINARY[op].format(b=self.operand(b), c=self.operand(c))}", line)
+            elif op in UNARY:
+                self.emit(depth, f"v{a} = {UNARY[op].format(b=self.operand(b))}", line)
+            elif op == IPRT:
+                self.emit(depth, f"write(f\"{{{self.operand(a)}}}\\n\")", line)
+            elif op == RPRT:
+                self.emit(depth, f"write(f\"{{float({self.operand(a)})}}\\n\")", line)
+            elif op == IINP:
+                self.emit(depth, f"v{a} = read(int)", line)
+            elif op == RINP:
+                self.emit(depth, f"v{a} = read(float)", line)
+            else:
+                self.emit(depth, self.result)
+                break
+        else:
+            # falls into the next run, the appended HALT makes sure there is one
+            self.emit(depth, self.jump(end, start, looping))
+        if looping:
+            self.emit(depth - 1, "continue")
+
+    def jump(self, target, start, looping):
+        """ the statement that jumps to target from the run that starts at start """
+        if looping and target == start:
+            return "continue"
+        return f"run = {self.run_of[target]}; {'break' if looping else 'continue'}"
+
+    def source(self):
+        return "\n".join(self.lines) + "\n"
+
+
+def is_constant(value):
+    """ whether a literal can be written into the code as a Python constant """
+    return value == value and value not in (float('inf'), float('-inf'))
+
+
+def program_key(program):
+    digest = hashlib.sha256(f"{TRANSLATOR_VERSION} {sys.implementation.cache_tag}\n".encode())
+    digest.update(repr(program.code).encode())
+    digest.update(repr(program.memory).encode())
+    return digest.hexdigest()
+
+
+def load_compiled(key):
+    """ returns the cached (code, quad lines) of a program, or None """
+    if os.environ.get('CPQ_NO_AOT_CACHE'):
+        return None
+    try:
+        with open(os.path.join(default_cache_dir(), 'aot', key), 'rb') as file:
+            return marshal.load(file)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+
+
+def save_compiled(key, entry):
+    """ stores a compiled program, a cache that can't be written is just skipped """
+    if os.environ.get('CPQ_NO_AOT_CACHE'):
+        return
+    directory = os.path.join(default_cache_dir(), 'aot')
+    temp_name = os.path.join(directory, f"{key}.{os.getpid()}.tmp")
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with open(temp_name, 'wb') as file:
+            marshal.dump(entry, file)
+        os.replace(temp_name, os.path.join(directory, key))
+    except OSError:
+        pass
+
+
+class AotProgram:
+    """ a Quad program compiled into a Python function """
+    def __init__(self, program, function, quad_lines):
+        self.program = program
+        self.function = function
+        self.quad_lines = quad_lines
+        self.memory = None
+
+    @classmethod
+    def build(cls, program):
+        """ translates and compiles a QuadProgram (or quad lines), or takes it from the cache """
+        if not isinstance(program, QuadProgram):
+            program = QuadProgram.decode(program)
+        key = program_key(program)
+        entry = _compiled.get(key)
+        if entry is None:
+            entry = load_compiled(key)
+            if entry is None:
+                translation = Translation(program)
+                entry = (compile(translation.source(), CODE_NAME, 'exec'), translation.quad_lines)
+                save_compiled(key, entry)
+            _compiled[key] = entry
+            if len(_compiled) > MEMORY_CACHE_SIZE:
+                _compiled.popitem(last=False)
+        else:
+            _compiled.move_to_end(key)
+        code, quad_lines = entry
+        namespace = {}
+        exec(code, namespace)
+        return cls(program, namespace['quad_program'], quad_lines)
+
+    def run(self, stdin=None, stdout=None):
+        """ executes the program until HALT, returns the final memory image """
+        vm = QuadVM(stdin, stdout)
+        try:
+            self.memory = self.function(list(self.program.memory), vm.read_value, vm.stdout.write, int_division)
+        except (ArithmeticError, ValueError) as error:
+            raise QuadError(f"line {self.fault_line(error)}: {fault_message(error)}")
+        return self.memory
+
+    def fault_line(self, error):
+        """ the quad line of the instruction that raised error """
+        traceback = error.__traceback__
+        line = None
+        while traceback is not None:
+            if traceback.tb_frame.f_code.co_filename == CODE_NAME:
+                line = self.quad_lines.get(traceback.tb_lineno)
+            traceback = traceback.tb_next
+        return line
+
+    def variables(self):
+        """ returns the variable values of the last run by name """
+        return {name: self.memory[index] for name, index in self.program.symbols.items()}
+
+
+def run_file(filename, stdin=None, stdout=None):
+    """ decodes, compiles and runs a .qud file """
+    with open(filename, "r") as file:
+        program = QuadProgram.decode(file)
+    AotProgram.build(program).run(stdin, stdout)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print("Error! Invalid argument count. Usage: python quadaot.py <file_name>.qud")
+        sys.exit(1)
+    try:
+        run_file(sys.argv[1])
+    except (QuadError, IOError) as error:
+        print(f"Error! {error}")
+        sys.exit(1)
@@ -0,0 +1,260 @@
+""" QuadProfiler - runs Quad programs and measures where their time goes
+    every instruction records how many times it ran and the time until the next one started,
+    the instructions are summed up by the source line they were generated for (the .qmap
+    side table cpq.py --source-map writes, or the lineno of the Commands), and every jump
+    back to an earlier line is taken as the end of a loop, so the report shows how often
+    each loop was entered and how many iterations it ran.
+    the time of one instruction is mostly the overhead of measuring it, compare the times
+    with each other and not with a run on QuadVM
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from optimizer import OPERATIONS
+from quadvm import (QuadError, QuadProgram, QuadVM, fault_message, OPCODES, JMPZ, JUMP, IASN, RASN, ITOR, RTOI,
+                    IPRT, RPRT, IINP, RINP, HALT)
+
+# the instructions listed in the text report
+DEFAULT_TOP = 20
+
+NAMES = {opcode: name for name, opcode in OPCODES.items()}
+
+BINARY = {OPCODES[name]: function for name, function in OPERATIONS.items() if OPCODES[name] not in (ITOR, RTOI)}
+UNARY = {ITOR: float, RTOI: int}
+
+
+def load_source_map(filename):
+    """ reads a .qmap file into {quad line: source line} """
+    lines = {}
+    with open(filename, "r") as file:
+        for text in file:
+            fields = text.split()
+            if len(fields) == 2 and fields[0].isdigit() and fields[1].isdigit():
+                lines[int(fields[0])] = int(fields[1])
+    return lines
+
+
+def command_lines(commands):
+    """ the {quad line: source line} of Command objects, quad lines (strings) have no source lines """
+    return {line: command.lineno for line, command in enumerate(commands, start=1)
+            if getattr(command, 'lineno', None) is not None}
+
+
+class QuadProfiler(QuadVM):
+    """ a QuadVM that counts and times every instruction it runs """
+    def __init__(self, stdin=None, stdout=None):
+        super().__init__(stdin, stdout)
+        self.counts = []
+        self.times = []
+        self.taken = []
+
+    def run(self, program):
+        """ executes the program until HALT, returns a QuadProfile of the run """
+        if not isinstance(program, QuadProgram):
+            program = QuadProgram.decode(program)
+        code = program.code
+        self.memory = m = list(program.memory)
+        self.counts = counts = [0] * len(code)
+        self.times = times = [0.0] * len(code)
+        self.taken = taken = [0] * len(code)
+        write = self.stdout.write
+        read = self.read_value
+        binary = BINARY
+        unary = UNARY
+        clock = time.perf_counter
+        pc = 0
+        start = before = clock()
+        try:
+            while True:
+                op, a, b, c = code[pc]
+                index = pc
+                pc += 1
+                if op == JMPZ:
+                    if not m[b]:
+                        pc = a
+                        taken[index] += 1
+                elif op == JUMP:
+                    pc = a
+                    taken[index] += 1
+                elif op in binary:
+                    m[a] = binary[op](m[b], m[c])
+                elif op == IASN or op == RASN:
+                    m[a] = m[b]
+                elif op in unary:
+                    m[a] = unary[op](m[b])
+                elif op == IPRT:
+                    write(f"{m[a]}\n")
+                elif op == RPRT:
+                    write(f"{float(m[a])}\n")
+                elif op == IINP:
+                    m[a] = read(int)
+                elif op == RINP:
+                    m[a] = read(float)
+                else:
+                    counts[index] += 1
+                    break
+                counts[index] += 1
+                now = clock()
+                times[index] += now - before
+                before = now
+        except (ArithmeticError, ValueError) as error:
+            raise QuadError(f"line {pc}: {fault_message(error)}")
+        return QuadProfile(program, counts, times, taken, clock() - start)
+
+
+class QuadProfile:
+    """ the counts and times of one profiled run.
+        counts, times - how many times every instruction ran and the time it took, by code index
+        taken         - how many times every JUMP and JMPZ jumped
+        lines         - {quad line: source line}, empty when the source lines aren't known
+        source        - the lines of the source file, used to show the source of the hot lines """
+    def __init__(self, program, counts, times, taken, seconds):
+        self.program = program
+        self.counts = counts
+        self.times = times
+        self.taken = taken
+        self.seconds = seconds
+        self.lines = {}
+        self.source = []
+        names = {slot: name for name, slot in program.symbols.items()}
+        self.operand_names = [names.get(slot, repr(value)) for slot, value in enumerate(program.memory)]
+
+    def set_source(self, lines=None, source=None):
+        """ sets the source lines of the quads and the source text the report quotes """
+        self.lines = dict(lines or {})
+        self.source = source.splitlines() if isinstance(source, str) else list(source or ())
+
+    def quad(self, index):
+        """ the quad text of the instruction at index, jump targets are 1 based lines """
+        op, a, b, c = self.program.code[index]
+        if op == HALT:
+            return NAMES[op]
+        if op in (JUMP, JMPZ):
+            operands = [str(a + 1)] + ([self.operand_names[b]] if op == JMPZ else [])
+        elif op in (IPRT, RPRT, IINP, RINP):
+            operands = [self.operand_names[a]]
+        elif op in BINARY:
+            operands = [self.operand_names[slot] for slot in (a, b, c)]
+        else:
+            operands = [self.operand_names[slot] for slot in (a, b)]
+        return " ".join([NAMES[op]] + operands)
+
+    def source_text(self, lineno):
+        if lineno is not None and 1 <= lineno <= len(self.source):
+            return self.source[lineno - 1].strip()
+        return ''
+
+    def instructions(self):
+        """ the instructions that ran, most time first """
+        rows = []
+        for index, count in enumerate(self.counts):
+            if count:
+                rows.append({'line': index + 1, 'quad': self.quad(index), 'source_line': self.lines.get(index + 1),
+                             'count': count, 'seconds': self.times[index]})
+        rows.sort(key=lambda row: -row['seconds'])
+        return rows
+
+    def source_lines(self):
+        """ the counts and times summed up by source line, most time first """
+        totals = {}
+        for index, count in enumerate(self.counts):
+            if count:
+                lineno = self.lines.get(index + 1)
+                row = totals.setdefault(lineno, {'source_line': lineno, 'text': self.source_text(lineno),
+                                                 'quads': 0, 'count': 0, 'seconds': 0.0})
+                row['quads'] += 1
+                row['count'] += count
+                row['seconds'] += self.times[index]
+        return sorted(totals.values(), key=lambda row: -row['seconds'])
+
+    def loops(self):
+        """ the loops that ran, a loop starts at the target of a jump back to an earlier line.
+            entries is how many times control came into the loop from outside, trips how many
+            times it went back to its start """
+        trips = {}
+        for index, (op, a, b, c) in enumerate(self.program.code):
+            if op in (JUMP, JMPZ) and a <= index and self.taken[index]:
+                trips[a] = trips.get(a, 0) + self.taken[index]
+        rows = []
+        for start, count in trips.items():
+            lineno = self.lines.get(start + 1)
+            entries = self.counts[start] - count
+            rows.append({'line': start + 1, 'source_line': lineno, 'text': self.source_text(lineno),
+                         'entries': entries, 'trips': count,
+                         'average_trips': count / entries if entries > 0 else float(count)})
+        rows.sort(key=lambda row: -row['trips'])
+        return rows
+
+    def as_dict(self):
+        return {'seconds': self.seconds, 'instructions_run': sum(self.counts),
+                'instructions': self.instructions(), 'source_lines': self.source_lines(), 'loops': self.loops()}
+
+    def write_json(self, filename):
+        with open(filename, 'w') as file:
+            json.dump(self.as_dict(), file, indent=1)
+
+    def report(self, top=DEFAULT_TOP):
+        """ the profile as text lines, the top instructions, source lines and loops by time or trips """
+        measured = sum(self.times) or 1.0
+        lines = [f"{sum(self.counts)} instructions in {self.seconds:.3f}s"]
+        lines.append("")
+        lines.append(f"{'quad':>6}{'source':>8}{'count':>12}{'time':>10}{'%':>7}  instruction")
+        for row in self.instructions()[:top]:
+            lines.append(f"{row['line']:>6}{format_line(row['source_line']):>8}{row['count']:>12}"
+                         f"{row['seconds']:>9.4f}s{100 * row['seconds'] / measured:>6.1f}%  {row['quad']}")
+        if self.lines:
+            lines.append("")
+            lines.append(f"{'source':>6}{'quads':>8}{'count':>12}{'time':>10}{'%':>7}  statement")
+            for row in self.source_lines()[:top]:
+                lines.append(f"{format_line(row['source_line']):>6}{row['quads']:>8}{row['count']:>12}"
+                             f"{row['seconds']:>9.4f}s{100 * row['seconds'] / measured:>6.1f}%  {row['text']}")
+        loops = self.loops()
+        if loops:
+            lines.append("")
+            lines.append(f"{'quad':>6}{'source':>8}{'entries':>10}{'trips':>12}{'average':>10}  loop")
+            for row in loops[:top]:
+                lines.append(f"{row['line']:>6}{format_line(row['source_line']):>8}{row['entries']:>10}"
+                             f"{row['trips']:>12}{row['average_trips']:>10.1f}  {row['text']}")
+        return lines
+
+
+def format_line(lineno):
+    return '-' if lineno is None else str(lineno)
+
+
+def profile_file(filename, stdin=None, stdout=None):
+    """ decodes and profiles a .qud file, the .qmap and .ou files next to it are used when they exist """
+    with open(filename, "r") as file:
+        program = QuadProgram.decode(file)
+    profile = QuadProfiler(stdin, stdout).run(program)
+    base_name = os.path.splitext(filename)[0]
+    lines = source = None
+    if os.path.exists(f"{base_name}.qmap"):
+        lines = load_source_map(f"{base_name}.qmap")
+    if os.path.exists(f"{base_name}.ou"):
+        with open(f"{base_name}.ou", "r") as file:
+            source = file.read().strip()
+    profile.set_source(lines, source)
+    return profile
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(prog="quadprof.py", description="profiles a Quad program")
+    arg_parser.add_argument("file", help="<file_name>.qud, its .qmap and .ou files are read when they exist")
+    arg_parser.add_argument("--json", metavar="FILE", help="write the profile as JSON")
+    arg_parser.add_argument("--top", type=int, default=DEFAULT_TOP, help="rows of every table (default: %(default)s)")
+    args = arg_parser.parse_args()
+    try:
+        profile = profile_file(args.file)
+    except (QuadError, IOError) as error:
+        print(f"Error! {error}")
+        sys.exit(1)
+    for line in profile.report(args.top):
+        print(line)
+    if args.json:
+        try:
+            profile.write_json(args.json)
+        except IOError:
+            print(f"fio: Unable to write to file '{args.json}'.")
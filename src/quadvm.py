@@ -0,0 +1,261 @@
+""" QuadVM - executes Quad programs produced by the compiler
+    QuadProgram - a Quad program decoded once into integer opcodes, operand slots and jump targets
+    QuadVM - runs a decoded program with a single dispatch loop
+"""
+import re
+import sys
+
+# opcodes are numbered roughly by how often they run, the dispatch loop tests them in this order
+JMPZ, JUMP, IASN, IADD, ISUB, ILSS, IGRT, IEQL, INQL, IMLT, IDIV, ITOR, RTOI, \
+    RASN, RADD, RSUB, RLSS, RGRT, REQL, RNQL, RMLT, RDIV, IPRT, RPRT, IINP, RINP, HALT = range(27)
+
+OPCODES = {
+    'JMPZ': JMPZ, 'JUMP': JUMP, 'IASN': IASN, 'IADD': IADD, 'ISUB': ISUB, 'ILSS': ILSS, 'IGRT': IGRT,
+    'IEQL': IEQL, 'INQL': INQL, 'IMLT': IMLT, 'IDIV': IDIV, 'ITOR': ITOR, 'RTOI': RTOI,
+    'RASN': RASN, 'RADD': RADD, 'RSUB': RSUB, 'RLSS': RLSS, 'RGRT': RGRT, 'REQL': REQL, 'RNQL': RNQL,
+    'RMLT': RMLT, 'RDIV': RDIV, 'IPRT': IPRT, 'RPRT': RPRT, 'IINP': IINP, 'RINP': RINP, 'HALT': HALT,
+}
+
+# number of operands each opcode takes
+ARITY = {
+    JMPZ: 2, JUMP: 1, IASN: 2, RASN: 2, ITOR: 2, RTOI: 2,
+    IADD: 3, ISUB: 3, IMLT: 3, IDIV: 3, ILSS: 3, IGRT: 3, IEQL: 3, INQL: 3,
+    RADD: 3, RSUB: 3, RMLT: 3, RDIV: 3, RLSS: 3, RGRT: 3, REQL: 3, RNQL: 3,
+    IPRT: 1, RPRT: 1, IINP: 1, RINP: 1, HALT: 0,
+}
+
+
+# the literal operands: the NUM literals of the front end and the repr of an int or a finite
+# float the optimizer writes (a leading -, an exponent). a variable name, even one like inf or
+# nan, never matches
+NUMBER = re.compile(r'-?([0-9]+\.?[0-9]*|\.[0-9]+)(e[-+]?[0-9]+)?')
+
+
+class QuadError(Exception):
+    """ raised for malformed quad programs and for runtime faults """
+
+
+class InputError(ValueError):
+    """ raised by read_value for a missing or illegal input value, the machine reports it
+        like an arithmetic fault with the line of the input instruction """
+
+
+def parse_number(text):
+    """ returns the numeric value of a literal operand, or None if it is a variable name """
+    match = NUMBER.fullmatch(text)
+    if match is None:
+        return None
+    if '.' in text or match.group(2):
+        return float(text)
+    try:
+        return int(text)
+    except ValueError:
+        # more digits than int() converts
+        return float(text)
+
+
+def int_division(left, right):
+    """ integer division that truncates toward zero like the Quad machine """
+    quotient = abs(left) // abs(right)
+    return quotient if (left >= 0) == (right >= 0) else -quotient
+
+
+def fault_message(error):
+    """ the message of the arithmetic or value error an instruction raised, like converting
+        an infinite float to int or an int too large for a float """
+    if isinstance(error, ZeroDivisionError):
+        return "division by zero"
+    return str(error)
+
+
+class QuadProgram:
+    """ a decoded Quad program.
+        code    - list of (opcode, a, b, c) tuples, a/b/c are memory slots or jump targets (0 based)
+        memory  - initial memory image, literals already stored in their slots
+        symbols - variable name -> memory slot
+    """
+    def __init__(self, code, memory, symbols):
+        self.code = code
+        self.memory = memory
+        self.symbols = symbols
+
+    @classmethod
+    def decode(cls, lines):
+        """ decodes quad lines (strings, token lists or Command objects) into a program.
+            lines after the last HALT that are not instructions (the signature line) are ignored """
+        code = []
+        memory = []
+        symbols = {}
+        literals = {}
+
+        def slot(operand):
+            operand = str(operand)
+            if operand in symbols:
+                return symbols[operand]
+            if operand in literals:
+                return literals[operand]
+            value = parse_number(operand)
+            memory.append(0 if value is None else value)
+            if value is None:
+                symbols[operand] = len(memory) - 1
+            else:
+                literals[operand] = len(memory) - 1
+            return len(memory) - 1
+
+        raw = []
+        halted = False
+        for line_no, line in enumerate(lines, start=1):
+            if isinstance(line, str):
+                tokens = line.split()
+            elif isinstance(line, (list, tuple)):
+                tokens = [str(token) for token in line]
+            else:
+                tokens = [str(arg) for arg in (line.opcode, line.arg1, line.arg2, line.arg3) if arg != '']
+            if not tokens:
+                continue
+            opcode = OPCODES.get(tokens[0])
+            if opcode is None:
+                if halted:
+                    break
+                raise QuadError(f"line {line_no}: unknown opcode '{tokens[0]}'")
+            if len(tokens) - 1 != ARITY[opcode]:
+                raise QuadError(f"line {line_no}: '{tokens[0]}' expects {ARITY[opcode]} operands")
+            halted = halted or opcode == HALT
+            raw.append((line_no, opcode, tokens[1:]))
+
+        end = len(raw)
+        for line_no, opcode, operands in raw:
+            if opcode in (JUMP, JMPZ):
+                target = parse_number(operands[0])
+                if not isinstance(target, int) or not 1 <= target <= end + 1:
+                    raise QuadError(f"line {line_no}: illegal jump target '{operands[0]}'")
+                args = [target - 1] + [slot(operand) for operand in operands[1:]]
+            else:
+                args = [slot(operand) for operand in operands]
+            args += [0] * (3 - len(args))
+            code.append((opcode, *args))
+
+        # jumping or falling past the last line stops the machine
+        code.append((HALT, 0, 0, 0))
+        return cls(code, memory, symbols)
+
+
+class QuadVM:
+    """ runs decoded Quad programs.
+        input values are read as whitespace separated tokens from stdin,
+        output values are written one per line to stdout
+    """
+    def __init__(self, stdin=None, stdout=None):
+        self.stdin = stdin if stdin is not None else sys.stdin
+        self.stdout = stdout if stdout is not None else sys.stdout
+        self.memory = None
+        self._pending = []
+
+    def read_value(self, convert):
+        """ reads the next input value """
+        while not self._pending:
+            line = self.stdin.readline()
+            if not line:
+                raise InputError("input exhausted")
+            self._pending = line.split()[::-1]
+        token = self._pending.pop()
+        try:
+            return convert(token)
+        except ValueError:
+            raise InputError(f"illegal input value '{token}'")
+
+    def run(self, program):
+        """ executes the program until HALT, returns the final memory image """
+        if not isinstance(program, QuadProgram):
+            program = QuadProgram.decode(program)
+        code = program.code
+        self.memory = m = list(program.memory)
+        write = self.stdout.write
+        read = self.read_value
+        pc = 0
+        try:
+            while True:
+                op, a, b, c = code[pc]
+                pc += 1
+                if op < IMLT:
+                    if op == JMPZ:
+                        if not m[b]:
+                            pc = a
+                    elif op == JUMP:
+                        pc = a
+                    elif op == IASN:
+                        m[a] = m[b]
+                    elif op == IADD:
+                        m[a] = m[b] + m[c]
+                    elif op == ISUB:
+                        m[a] = m[b] - m[c]
+                    elif op == ILSS:
+                        m[a] = 1 if m[b] < m[c] else 0
+                    elif op == IGRT:
+                        m[a] = 1 if m[b] > m[c] else 0
+                    elif op == IEQL:
+                        m[a] = 1 if m[b] == m[c] else 0
+                    else:
+                        m[a] = 1 if m[b] != m[c] else 0
+                elif op < RASN:
+                    if op == IMLT:
+                        m[a] = m[b] * m[c]
+                    elif op == IDIV:
+                        m[a] = int_division(m[b], m[c])
+                    elif op == ITOR:
+                        m[a] = float(m[b])
+                    else:
+                        m[a] = int(m[b])
+                elif op < IPRT:
+                    if op == RASN:
+                        m[a] = m[b]
+                    elif op == RADD:
+                        m[a] = m[b] + m[c]
+                    elif op == RSUB:
+                        m[a] = m[b] - m[c]
+                    elif op == RLSS:
+                        m[a] = 1 if m[b] < m[c] else 0
+                    elif op == RGRT:
+                        m[a] = 1 if m[b] > m[c] else 0
+                    elif op == REQL:
+                        m[a] = 1 if m[b] == m[c] else 0
+                    elif op == RNQL:
+                        m[a] = 1 if m[b] != m[c] else 0
+                    elif op == RMLT:
+                        m[a] = m[b] * m[c]
+                    else:
+                        m[a] = m[b] / m[c]
+                elif op == IPRT:
+                    write(f"{m[a]}\n")
+                elif op == RPRT:
+                    write(f"{float(m[a])}\n")
+                elif op == IINP:
+                    m[a] = read(int)
+                elif op == RINP:
+                    m[a] = read(float)
+                else:
+                    return m
+        except (ArithmeticError, ValueError) as error:
+            raise QuadError(f"line {pc}: {fault_message(error)}")
+
+    def variables(self, program):
+        """ returns the variable values of the last run by name """
+        return {name: self.memory[index] for name, index in program.symbols.items()}
+
+
+def run_file(filename, stdin=None, stdout=None):
+    """ decodes and runs a .qud file """
+    with open(filename, "r") as file:
+        program = QuadProgram.decode(file)
+    QuadVM(stdin, stdout).run(program)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print("Error! Invalid argument count. Usage: python quadvm.py <file_name>.qud")
+        sys.exit(1)
+    try:
+        run_file(sys.argv[1])
+    except (QuadError, IOError) as error:
+        print(f"Error! {error}")
+        sys.exit(1)
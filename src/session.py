@@ -0,0 +1,96 @@
+""" CompileSession - one compilation of a CPL source into quads
+    every session owns its lexer, parser, interpreter (with the symbol table, labels and
+    commands) and diagnostics, so sessions don't share state and can run side by side
+    in one process. compile_source is the library entry point
+"""
+from interpreter import Diagnostics, Interpreter, SWITCH_SEARCH_MIN
+from fast_lexer import LEXERS
+from parser_cpq import ParserCPQ
+from optimizer import Optimizer
+from ast_cpq import count_nodes
+
+
+class CompileResult:
+    """ the outcome of a compile.
+        commands    - the optimized quad commands, None when the compile failed
+        diagnostics - the lexical, syntax and semantic messages in the order they were found
+        parsed      - False when the source could not be parsed at all
+        stats       - what the optimization passes changed
+    """
+    def __init__(self, commands, diagnostics, parsed=True, stats=None):
+        self.commands = commands
+        self.diagnostics = diagnostics
+        self.parsed = parsed
+        self.stats = stats or {}
+
+    @property
+    def ok(self):
+        return self.commands is not None
+
+    def lines(self):
+        """ the quad lines of the program, without the signature line """
+        return [str(command) for command in self.commands or ()]
+
+
+class CompileSession:
+    """ compiles a single source, create a new session for every compile.
+        switch_search_min - switches with this many cases and more test them with a binary
+                            search, 0 keeps the linear case tests
+        metrics           - a PhaseMetrics that measures every phase of the compile
+        lexer             - 'fast' for the FastLexerCPQ, 'sly' for the LexerCPQ, they give the same tokens """
+    def __init__(self, switch_search_min=SWITCH_SEARCH_MIN, metrics=None, lexer='fast'):
+        self.metrics = metrics
+        self.diagnostics = Diagnostics()
+        self.interpreter = Interpreter(self.diagnostics, switch_search_min)
+        self.lexer = LEXERS[lexer](self.diagnostics)
+        self.parser = ParserCPQ(self.diagnostics)
+
+    def tokenize(self, source):
+        if isinstance(source, str):
+            return self.lexer.tokenize(source)
+        return self.lexer.tokenize_chunks(source.chunks())
+
+    def compile(self, source):
+        """ compiles source text, or a MappedSource which is lexed chunk by chunk """
+        if self.metrics is not None:
+            return self.compile_phases(source)
+        ast = self.parser.parse(self.tokenize(source))
+        if ast is None:
+            return CompileResult(None, self.diagnostics.messages, parsed=False)
+
+        optimizer = Optimizer(self.interpreter.table)
+        commands = optimizer.optimize(ast.gen(self.interpreter))
+        if self.diagnostics.found_errors != 0:
+            commands = None
+        return CompileResult(commands, self.diagnostics.messages, stats=optimizer.stats)
+
+    def compile_phases(self, source):
+        """ compiles like compile, one phase after the other under the metrics. all the tokens
+            are read before the parser starts, so lexing and parsing are measured apart """
+        metrics = self.metrics
+        with metrics.phase('lex') as phase:
+            tokens = list(self.tokenize(source))
+            phase.counts['tokens'] = len(tokens)
+        with metrics.phase('parse') as phase:
+            ast = self.parser.parse(iter(tokens))
+            phase.counts['nodes'] = count_nodes(ast) if ast is not None else 0
+        del tokens
+        if ast is None:
+            return CompileResult(None, self.diagnostics.messages, parsed=False)
+
+        with metrics.phase('gen') as phase:
+            commands = ast.gen(self.interpreter)
+            phase.counts['quads'] = len(commands)
+        del ast
+        optimizer = Optimizer(self.interpreter.table)
+        with metrics.phase('optimize') as phase:
+            commands = optimizer.optimize(commands)
+            phase.counts['quads'] = len(commands)
+        if self.diagnostics.found_errors != 0:
+            commands = None
+        return CompileResult(commands, self.diagnostics.messages, stats=optimizer.stats)
+
+
+def compile_source(text, **options):
+    """ compiles CPL source text, returns a CompileResult. options are the CompileSession options """
+    return CompileSession(**options).compile(text)
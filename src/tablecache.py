@@ -0,0 +1,102 @@
+""" TableCache - keeps the generated lexer and parser tables on disk
+    the entries are keyed by a hash of the grammar and token definitions, and every entry
+    also stores the definitions themselves, so a changed grammar or lexer never loads stale
+    tables, it misses the cache and simply builds (and stores) new ones.
+    set CPQ_CACHE_DIR to move the cache, or CPQ_NO_TABLE_CACHE to switch it off
+"""
+import marshal
+import os
+import re
+import zlib
+import sly
+
+# bump when the layout of the stored entries changes
+CACHE_VERSION = 1
+
+
+def default_cache_dir():
+    """ the directory of the compiler caches """
+    return os.environ.get('CPQ_CACHE_DIR') or os.path.join(os.path.expanduser('~'), '.cache', 'cpq')
+
+
+class TableKey:
+    """ identifies a cache entry by the definitions its table is generated from """
+    def __init__(self, kind, definitions):
+        self.text = '\n'.join([f"{kind} {CACHE_VERSION} {sly.__version__}"] +
+                              [repr(definition) for definition in definitions])
+        self.name = f"{kind}-{zlib.crc32(self.text.encode()):08x}"
+
+
+def load(key):
+    """ returns the cached table for key, or None """
+    if os.environ.get('CPQ_NO_TABLE_CACHE'):
+        return None
+    try:
+        with open(os.path.join(default_cache_dir(), 'tables', key.name), 'rb') as file:
+            text, table = marshal.load(file)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    return table if text == key.text else None
+
+
+def save(key, table):
+    """ stores a table, a cache that can't be written is just skipped """
+    if os.environ.get('CPQ_NO_TABLE_CACHE'):
+        return
+    directory = os.path.join(default_cache_dir(), 'tables')
+    temp_name = os.path.join(directory, f"{key.name}.{os.getpid()}.tmp")
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with open(temp_name, 'wb') as file:
+            marshal.dump((key.text, table), file)
+        os.replace(temp_name, os.path.join(directory, key.name))
+    except OSError:
+        pass
+
+
+class ParseTables:
+    """ the parts of sly's LRTable the parser runs with """
+    def __init__(self, lr_action, lr_goto, defaulted_states):
+        self.lr_action = lr_action
+        self.lr_goto = lr_goto
+        self.defaulted_states = defaulted_states
+
+    def to_entry(self):
+        return self.lr_action, self.lr_goto, self.defaulted_states
+
+
+def grammar_key(grammar):
+    """ the cache key of a sly grammar """
+    return TableKey('parser', [sorted(grammar.Terminals), grammar.Precedence, grammar.Start] +
+                     [(str(production), production.prec) for production in grammar.Productions])
+
+
+def lexer_key(lexer_cls):
+    """ the cache key of a sly lexer class, taken from its token definitions """
+    definitions = [sorted(lexer_cls.tokens), sorted(lexer_cls.literals), lexer_cls.ignore, lexer_cls.reflags,
+                   sorted(lexer_cls._remap.items())]
+    for name, value in lexer_cls._attributes.items():
+        if isinstance(value, str) or hasattr(value, 'pattern'):
+            definitions.append((name, getattr(value, 'pattern', value)))
+    return TableKey('lexer', definitions)
+
+
+class _ValidatedPattern:
+    """ stands in for a rule pattern that was already validated when the cache entry was written """
+    @staticmethod
+    def match(text):
+        return None
+
+
+class CachedRegex:
+    """ regex module used while a lexer is built from a cache entry,
+        sly compiles and checks every rule on its own before the master expression,
+        with a cached master expression only the master is compiled
+    """
+    def __init__(self, master):
+        self.master = master
+
+    def compile(self, pattern, flags=0):
+        if pattern == self.master:
+            return re.compile(pattern, flags)
+        return _ValidatedPattern
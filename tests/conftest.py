@@ -0,0 +1,7 @@
+""" puts the compiler sources and the benchmark generator on the import path of the tests """
+import os
+import sys
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, os.pardir, 'src'))
+sys.path.insert(0, os.path.join(TESTS_DIR, os.pardir, 'benchmarks'))
@@ -0,0 +1,84 @@
+""" the conditions of if and while statements have to take the branch Python takes for the same expression """
+import random
+import signal
+from io import StringIO
+import pytest
+from quadvm import QuadProgram, QuadVM
+from session import CompileSession
+
+RELOPS = ['==', '!=', '<', '>', '<=', '>=']
+VALUES = [(0, 0, 0.5), (1, 2, 2.0), (3, 1, -1.5), (2, 2, 2.0), (-4, 5, 0.0)]
+
+# a run longer than this is taken for a program that loops forever
+RUN_SECONDS = 5
+
+# the conditions || and ! got wrong: a false left side of || jumped back to its own test, a true
+# one fell into the right side, and !(x) took the true branch either way
+SHORT_CIRCUITS = [
+    ("a > b || a < 0", (5, 1, 0.0), 1),
+    ("a > b || a == 1", (1, 5, 0.0), 1),
+    ("a > b || a == 2", (1, 5, 0.0), 0),
+    ("!(a > b)", (5, 1, 0.0), 0),
+    ("!(a > b)", (1, 5, 0.0), 1),
+    ("a < b && !(f > 1)", (1, 5, 2.0), 0),
+    ("!(a > b || f < 0) && a != 0", (1, 5, 0.5), 1),
+]
+
+
+def condition(rng, depth):
+    """ a random condition as (CPL text, Python text) """
+    roll = rng.random()
+    if depth == 0 or roll < 0.3:
+        left, right = rng.sample(['a', 'b', 'f', '1', '2'], 2)
+        operator = rng.choice(RELOPS)
+        return f"{left} {operator} {right}", f"{left} {operator} {right}"
+    if roll < 0.45:
+        text, python = condition(rng, depth - 1)
+        return f"!({text})", f"not ({python})"
+    operator, python_operator = rng.choice([('&&', 'and'), ('||', 'or')])
+    left, right = condition(rng, depth - 1), condition(rng, depth - 1)
+    # the grammar has no parentheses around a condition, !(!(...)) groups an || under an &&
+    if operator == '&&':
+        left, right = [(f"!(!({side[0]}))", side[1]) if ' || ' in side[0] else side for side in (left, right)]
+    return f"{left[0]} {operator} {right[0]}", f"({left[1]}) {python_operator} ({right[1]})"
+
+
+def timed_out(signum, frame):
+    raise TimeoutError(f"the program ran longer than {RUN_SECONDS}s")
+
+
+def run(text, values):
+    result = CompileSession().compile(text)
+    assert result.ok, result.diagnostics
+    out = StringIO()
+    previous = signal.signal(signal.SIGALRM, timed_out)
+    signal.alarm(RUN_SECONDS)
+    try:
+        QuadVM(StringIO(" ".join(map(str, values))), out).run(QuadProgram.decode(result.lines()))
+    finally:
+        signal.alarm(0)
+        signal.signal(signal.SIGALRM, previous)
+    return out.getvalue().split()
+
+
+@pytest.mark.parametrize('text, values, expected', SHORT_CIRCUITS)
+def test_short_circuit(text, values, expected):
+    program = f"a, b: int; f: float;\n{{ input(a); input(b); input(f);\n if ({text}) output(1); else output(0);\n}}\n"
+    assert run(program, values) == [str(expected)]
+
+
+@pytest.mark.parametrize('seed', range(40))
+def test_if_condition(seed):
+    text, python = condition(random.Random(seed), 3)
+    program = f"a, b: int; f: float;\n{{ input(a); input(b); input(f);\n if ({text}) output(1); else output(0);\n}}\n"
+    for a, b, f in VALUES:
+        assert run(program, (a, b, f)) == [str(int(eval(python)))], text
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_while_condition(seed):
+    text, python = condition(random.Random(1000 + seed), 2)
+    program = (f"a, b, n: int; f: float;\n{{ input(a); input(b); input(f);\n n = 0;\n"
+               f" while (n < 3 && !(!({text}))) n = n + 1;\n output(n);\n}}\n")
+    for a, b, f in VALUES:
+        assert run(program, (a, b, f)) == [str(3 if eval(python) else 0)], text
@@ -0,0 +1,32 @@
+""" a compile that hits the cache reports the same messages and writes the same .qud file as the compile that filled it """
+from contextlib import redirect_stderr, redirect_stdout
+from io import StringIO
+import pytest
+from compile_cache import CompileCache
+from cpq import compile_file
+
+SOURCES = {
+    'lexical_error': "a: int;\n{ a = 1 $ ; output(a); }\n",
+    'cast_warning': "a: int;\n{ a = cast<int>(a); output(a); }\n",
+}
+
+
+def compile_twice(tmp_path, text):
+    source = tmp_path / 'prog.ou'
+    source.write_text(text)
+    cache = CompileCache(str(tmp_path / 'cache'))
+    runs = []
+    for _ in range(2):
+        out = StringIO()
+        with redirect_stdout(out), redirect_stderr(StringIO()):
+            compile_file(str(source), cache=cache)
+        runs.append((out.getvalue(), (tmp_path / 'prog.qud').read_bytes()))
+    return runs
+
+
+@pytest.mark.parametrize('name', sorted(SOURCES))
+def test_cache_hit_reports_the_diagnostics(tmp_path, name):
+    (first_output, first_quads), (second_output, second_quads) = compile_twice(tmp_path, SOURCES[name])
+    assert 'line 2' in first_output
+    assert second_output == first_output
+    assert second_quads == first_quads
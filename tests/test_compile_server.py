@@ -0,0 +1,62 @@
+""" a compile on the compile server uses the options and the cache switch of its request """
+import os
+import threading
+from contextlib import redirect_stdout
+from io import StringIO
+import pytest
+from compile_cache import CompileCache
+from compile_server import CompileServer, handle_request
+from cpq import compile_remote
+from session import CompileSession
+
+SWITCH = ("a, x: int;\n{ input(a);\n switch (a) {\n case 1: x = 1; break;\n case 2: x = 2; break;\n"
+          " case 3: x = 3; break;\n default: x = 0; break;\n }\n output(x);\n}\n")
+
+
+def test_request_options_set_the_compile():
+    assert CompileSession(0).compile(SWITCH).lines() != CompileSession(1).compile(SWITCH).lines()
+    for switch_search_min in (0, 1):
+        response = handle_request({'source': SWITCH, 'options': {'switch_search_min': switch_search_min}},
+                                  options={'switch_search_min': 8})
+        assert response['ok']
+        assert response['quads'] == CompileSession(switch_search_min).compile(SWITCH).lines()
+    response = handle_request({'source': SWITCH, 'options': {'lexer': 'sly'}})
+    assert response['quads'] == CompileSession().compile(SWITCH).lines()
+
+
+@pytest.mark.parametrize('options, message', [
+    ({'switch_search_min': 'many'}, "Illegal value 'many' of option 'switch_search_min'."),
+    ({'lexer': 'slow'}, "Illegal value 'slow' of option 'lexer'."),
+    ({'optimize': False}, "Unknown option 'optimize'."),
+    (['lexer'], "Request options are not an object."),
+])
+def test_illegal_request_options(options, message):
+    assert handle_request({'source': SWITCH, 'options': options}) == {'ok': False, 'error': message}
+
+
+def test_request_without_cache(tmp_path):
+    cache = CompileCache(str(tmp_path / 'cache'))
+    assert handle_request({'source': SWITCH}, cache)['stats']
+    # a cache hit has no stats
+    assert not handle_request({'source': SWITCH}, cache)['stats']
+    assert handle_request({'source': SWITCH, 'cache': False}, cache)['stats']
+
+
+def test_compile_remote(tmp_path):
+    socket_path = str(tmp_path / 'cpq.sock')
+    server = CompileServer(socket_path, CompileCache(str(tmp_path / 'cache')), {'switch_search_min': 8})
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        source = tmp_path / 'prog.ou'
+        source.write_text(SWITCH)
+        out = StringIO()
+        with redirect_stdout(out):
+            quads = compile_remote(str(source), socket_path, {'switch_search_min': 1}, use_cache=False,
+                                   show_stats=True)
+        assert quads == CompileSession(1).compile(SWITCH).lines()
+        assert "Optimizer: " in out.getvalue()
+    finally:
+        server.shutdown()
+        server.server_close()
+        os.remove(socket_path)
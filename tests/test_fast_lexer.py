@@ -0,0 +1,37 @@
+""" FastLexerCPQ has to produce the tokens and the lexical errors of LexerCPQ """
+import os
+import pytest
+from cpl_generator import ProgramGenerator
+from fast_lexer import compare_lexers
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+EDGE_CASES = [
+    "a: int;\n{ a = 1 $ ; output(a); }\n",
+    "a: int; { a = 1; @ # ? ` ~ ^ ' \" \\ output(a); }",
+    "a: int; /* a comment that never ends\n{ a = 1; }\n",
+    "a: int; { a = 1; } /*",
+    "a: int; /*/ a /*/ { a = 1; } /* * / */ /**/ /***/",
+    "/* line\n one */ a: float; { a = 1.5 ; output(a); } */",
+    "a: int; { a = 12.; a = .5; a = 1.2.3; a = 007; }",
+    "a, b: int; { if (a <= b || a != b && !(a >= b)) a = cast<float>(b); else b = cast<int>(a); }",
+    "",
+    "\n\n\t  \r\n",
+]
+
+
+@pytest.mark.parametrize('name', ['input.ou', 'err_input.ou'])
+def test_lexers_agree_on_test_inputs(name):
+    with open(os.path.join(TESTS_DIR, name), 'r') as file:
+        assert compare_lexers(file.read()) is None
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_lexers_agree_on_generated_programs(seed):
+    text = ProgramGenerator(seed, declarations=12, depth=3).program(statements=15)
+    assert compare_lexers(text) is None
+
+
+@pytest.mark.parametrize('text', EDGE_CASES)
+def test_lexers_agree_on_edge_cases(text):
+    assert compare_lexers(text) is None
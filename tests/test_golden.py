@@ -0,0 +1,19 @@
+""" the .qud of tests/input.ou has to stay byte for byte the committed tests/input.qud,
+    regenerate it with cpq.py when an optimizer change is meant to change the output """
+import os
+import shutil
+from contextlib import redirect_stderr, redirect_stdout
+from io import StringIO
+from cpq import compile_file
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_input_matches_golden_output(tmp_path):
+    source = tmp_path / 'input.ou'
+    shutil.copy(os.path.join(TESTS_DIR, 'input.ou'), source)
+    with redirect_stdout(StringIO()), redirect_stderr(StringIO()):
+        assert compile_file(str(source)) is not None
+    with open(os.path.join(TESTS_DIR, 'input.qud'), 'rb') as file:
+        golden = file.read()
+    assert (tmp_path / 'input.qud').read_bytes() == golden
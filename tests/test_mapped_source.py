@@ -0,0 +1,52 @@
+""" a streamed compile, which lexes the memory mapped source in chunks, has to print and write what
+    a compile of the whole source does, whatever the chunk size """
+import os
+import shutil
+from contextlib import redirect_stderr, redirect_stdout
+from io import StringIO
+import pytest
+import mapped_source
+from cpq import compile_file
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+COMMENTS = """a, b: int; /*/ a comment that starts like it ends /*/
+{ input(a); /* one
+line */ b = a */* a comment right after an operator */ 2;
+  /**/ output(b); /***/ /* * / */
+  /*/ a comment that is still open
+     at the end of the line */ /* a comment
+     over / * some
+     lines */ if (a > b || !(a == b)) output(a); else output(b); /*/*/
+}
+"""
+UNCLOSED = """a, b: int;
+{ input(a);
+  b = a / 2; /* never closed
+  output(b);
+}
+"""
+
+
+def compile_output(source, stream):
+    out = StringIO()
+    with redirect_stdout(out), redirect_stderr(StringIO()):
+        compile_file(str(source), stream=stream)
+    quads = source.with_suffix('.qud')
+    written = quads.read_bytes() if quads.exists() else None
+    if quads.exists():
+        quads.unlink()
+    return out.getvalue(), written
+
+
+@pytest.mark.parametrize('chunk_size', [1, 5, 16, 64])
+@pytest.mark.parametrize('name', ['input.ou', 'comments', 'unclosed'])
+def test_streamed_compile_matches(tmp_path, monkeypatch, name, chunk_size):
+    source = tmp_path / 'prog.ou'
+    if name == 'input.ou':
+        shutil.copy(os.path.join(TESTS_DIR, name), source)
+    else:
+        source.write_text(COMMENTS if name == 'comments' else UNCLOSED)
+    expected = compile_output(source, False)
+    monkeypatch.setattr(mapped_source, 'CHUNK_SIZE', chunk_size)
+    assert compile_output(source, True) == expected
@@ -0,0 +1,93 @@
+""" the optimizer passes: their statistics, and programs that have to run as they run without them """
+from io import StringIO
+import pytest
+from optimizer import Optimizer
+from quadvm import QuadError, QuadProgram, QuadVM
+from session import CompileSession
+
+
+@pytest.mark.parametrize('text, temps', [
+    ("a: int;\n{ input(a); output(a); }\n", 0),
+    ("a, b: int;\n{ input(a); b = a * 2 + a; output(b); }\n", 1),
+])
+def test_temps_stats(text, temps):
+    result = CompileSession().compile(text)
+    assert result.ok
+    assert result.stats['temps'] == temps
+    assert result.stats['temps_before'] >= temps
+    assert list(result.stats).index('temps_before') + 1 == list(result.stats).index('temps')
+
+
+def run(text, stdin):
+    result = CompileSession().compile(text)
+    assert result.ok, result.diagnostics
+    stdout = StringIO()
+    QuadVM(StringIO(stdin), stdout).run(QuadProgram.decode(result.lines()))
+    return stdout.getvalue()
+
+
+def fault(text, stdin):
+    """ the message of the QuadError the program stops with, without its line """
+    with pytest.raises(QuadError) as error:
+        run(text, stdin)
+    return str(error.value).split(": ", 1)[1]
+
+
+@pytest.mark.parametrize('name', ['inf', 'nan', 'Infinity', 'NaN'])
+def test_float_names_are_variables(name, monkeypatch):
+    text = f"{name}, y: int;\n{{ input({name}); if ({name} < 5 && {name} == {name}) y = 1; else y = 0; output(y); }}\n"
+    optimized = run(text, "1")
+    monkeypatch.setattr(Optimizer, 'PASSES', ())
+    assert optimized == run(text, "1") == "1\n"
+
+
+@pytest.mark.parametrize('text, stdin, message', [
+    ("f: float; x: int;\n{ input(f); x = cast<int>(f); output(1); }\n", "inf",
+     "cannot convert float infinity to integer"),
+    ("f: float; x: int;\n{ input(f); x = cast<int>(f); output(1); }\n", "nan", "cannot convert float NaN to integer"),
+    ("i, n: int; g: float;\n{ input(i); n = 0; while (n < 12) { i = i * i; n = n + 1; }\n g = cast<float>(i); output(1); }\n",
+     "10", "int too large to convert to float"),
+])
+def test_unused_conversions_still_fault(text, stdin, message, monkeypatch):
+    assert fault(text, stdin) == message
+    monkeypatch.setattr(Optimizer, 'PASSES', ())
+    assert fault(text, stdin) == message
+
+
+def outcome(text, stdin):
+    """ the output of a run and the message of the QuadError it stops with, None if it halts """
+    try:
+        return run(text, stdin), None
+    except QuadError as error:
+        return None, str(error).split(": ", 1)[1]
+
+
+# (program, inputs, invariants hoisted) - zero-trip loops whose invariants fault, loops that
+# redefine an operand of a store, and nested loops whose inner invariants move out of both
+LOOPS = [
+    ("f, g: float; i, n, x: int;\n{ input(f); input(n); i = 0;\n"
+     " while (i < n) { x = cast<int>(f); g = f * 2.0; i = i + 1; }\n output(x); output(g); }\n",
+     ["inf 0", "nan 0", "inf 2", "2.5 3"], 1),
+    ("g: float; i, k, n: int;\n{ input(k); input(n); i = 0; while (i < 12) { k = k * k; i = i + 1; }\n"
+     " i = 0; while (i < n) { g = cast<float>(k); i = i + 1; }\n output(g); }\n",
+     ["10 0", "10 1", "1 3"], 0),
+    ("a, d, i, n, x: int;\n{ input(a); input(d); input(n); i = 0;\n"
+     " while (i < n) { x = a / d; i = i + 1; }\n output(x); }\n",
+     ["7 0 0", "7 0 2", "7 2 2"], 0),
+    ("a, i, n, y: int;\n{ input(a); input(n); i = 0;\n"
+     " while (i < n) { y = a + 1; a = a + y; i = i + 1; }\n output(a); output(y); }\n",
+     ["1 0", "1 4", "-3 2"], 0),
+    ("a, b, i, j, n, x, y: int;\n{ input(a); input(b); input(n); i = 0;\n"
+     " while (i < n) { j = 0; while (j < n) { x = a * b; y = y + x; j = j + 1; } i = i + 1; }\n"
+     " output(x); output(y); }\n",
+     ["2 3 0", "2 3 1", "2 3 4"], 2),
+]
+
+
+@pytest.mark.parametrize('text, inputs, hoisted', LOOPS)
+def test_hoisted_loops(text, inputs, hoisted, monkeypatch):
+    result = CompileSession().compile(text)
+    assert result.stats['hoisted_invariants'] == hoisted
+    optimized = [outcome(text, stdin) for stdin in inputs]
+    monkeypatch.setattr(Optimizer, 'PASSES', ())
+    assert optimized == [outcome(text, stdin) for stdin in inputs]
@@ -0,0 +1,172 @@
+""" the optimizer and the binary search of large switches must not change what a program does.
+    every program is compiled with and without the optimizer passes and with and without the
+    switch search, and QuadVM has to print the same output and stop with the same fault """
+from io import StringIO
+import pytest
+from cpl_generator import ProgramGenerator
+from optimizer import Optimizer
+from quadvm import QuadError, QuadProgram, QuadVM
+from session import CompileSession
+
+# (optimize, switch_search_min) - 0 turns the switch search off, 1 searches every switch
+CONFIGS = [(False, 0), (True, 0), (False, 1), (True, 1)]
+
+# the values of the int inputs and of the float inputs of a generated program, the float
+# inputs fault every cast<int> and the int inputs every division by an input
+INPUTS = [("3", "1.5"), ("0", "0.0"), ("-7", "-2.5"), ("12", "inf"), ("5", "nan")]
+
+
+def compile_program(text, optimize, switch_search_min):
+    with pytest.MonkeyPatch.context() as patch:
+        if not optimize:
+            patch.setattr(Optimizer, 'PASSES', ())
+        result = CompileSession(switch_search_min).compile(text)
+    assert result.ok, result.diagnostics
+    return QuadProgram.decode(result.lines())
+
+
+def outcome(program, stdin):
+    """ the output of a run and the fault it stops with, without the quad line, which moves
+        with the code around it """
+    stdout = StringIO()
+    try:
+        QuadVM(StringIO(stdin), stdout).run(program)
+    except QuadError as error:
+        return stdout.getvalue(), str(error).split(": ", 1)[1]
+    return stdout.getvalue(), None
+
+
+def assert_same_runs(text, inputs):
+    runs = {}
+    for optimize, switch_search_min in CONFIGS:
+        program = compile_program(text, optimize, switch_search_min)
+        runs[optimize, switch_search_min] = [outcome(program, stdin) for stdin in inputs]
+    for config, outcomes in runs.items():
+        assert outcomes == runs[CONFIGS[0]], config
+
+
+@pytest.mark.parametrize('seed', range(15))
+def test_generated_programs(seed):
+    generator = ProgramGenerator(seed, declarations=8, depth=3)
+    text = generator.program(statements=25)
+    # the generator only divides by literals, the division by a variable can fault
+    text = text[:text.rindex("}")] + "    i0 = i1 / i2;\n    f0 = f0 / i3;\n    output(i0);\n    output(f0);\n}\n"
+    inputs = [" ".join([int_value] * len(generator.ints) + [float_value] * len(generator.floats))
+              for int_value, float_value in INPUTS]
+    assert_same_runs(text, inputs)
+
+
+# fold_constants and thread_jumps: constant operations, branches decided at compile time,
+# operations on constants that fault or overflow, and jumps to jumps
+FOLDING = [
+    ("a, b, x: int; f: float;\n{ input(a); b = 6 * 7; x = b / 4 - 3; f = 1.5 * b;\n"
+     " if (x > 5) output(x); else output(a);\n while (b < 40) b = b + 1;\n output(b); output(f); }\n",
+     ["1", "-1"]),
+    ("a, x: int;\n{ input(a); x = 7 / 0; output(a); output(x); }\n", ["3"]),
+    ("a, x: int; f: float;\n{ input(a); f = 0.0; f = 1.5 / f; output(a); output(f); }\n", ["3"]),
+    ("a, x: int; f: float;\n{ input(a); f = 99999999.9;\n"
+     " x = 0; while (x < 40) { f = f * f; x = x + 1; }\n a = cast<int>(f); output(a); }\n", ["1"]),
+    ("a, b, x: int;\n{ input(a); input(b); x = 0;\n"
+     " if (a > 0) { if (b > 0) { x = 1; } else { x = 2; } } else { if (b > 0) x = 3; else x = 4; }\n"
+     " while (a > 0) { while (b > 0) { b = b - 1; x = x + 1; } a = a - 1; }\n"
+     " output(x); output(a); output(b); }\n", ["1 1", "1 0", "0 1", "0 0", "3 2"]),
+    ("inf, nan, y: int;\n{ input(inf); nan = inf;\n if (inf < 5 && nan == nan) y = 1; else y = 0; output(y); }\n",
+     ["1", "9"]),
+]
+
+
+@pytest.mark.parametrize('text, inputs', FOLDING)
+def test_folding(text, inputs):
+    assert_same_runs(text, inputs)
+
+
+def switch_program(values):
+    """ a switch over an input with a case for every value, the cases fall into each other
+        where a break is missing """
+    cases = "".join(f" case {value}: x = x + {value} * 3;{' break;' if index % 3 else ''}\n"
+                    for index, value in enumerate(values))
+    return f"a, x: int;\n{{ input(a); while (a != 99) {{ x = 1;\n switch (a) {{\n{cases} default: x = 0 - 1; break; }}\n" \
+           " output(x); input(a); } }\n"
+
+
+# the switch binary search: dense and sparse cases, two cases, a selector below, between and
+# above every case value, fallthrough and switches nested in the cases of a switch
+SWITCHES = [
+    (switch_program(range(12)), ["-1 0 1 5 6 11 12 99"]),
+    (switch_program([3, 7, 8, 10, 20, 21, 40, 64, 100, 1000]),
+     ["-1 0 3 4 7 8 9 10 11 20 21 22 40 63 64 100 999 1000 1001 99"]),
+    (switch_program([5, 3]), ["2 3 4 5 6 99"]),
+    ("a, b, x: int;\n{ input(a); input(b);\n switch (a) {\n case 1: switch (b) { case 1: x = 11; break; case 2: x = 12; break;\n"
+     " case 3: x = 13; break; default: x = 10; break; } break;\n case 2: x = 2; break;\n case 4: x = 4;\n"
+     " case 8: x = x + 8; break;\n default: x = 0; break; }\n output(x); }\n",
+     ["1 1", "1 2", "1 3", "1 4", "2 0", "4 0", "8 0", "3 0", "9 1"]),
+]
+
+
+@pytest.mark.parametrize('text, inputs', SWITCHES)
+def test_switches(text, inputs):
+    assert_same_runs(text, inputs)
+
+
+# eliminate_dead_code: unused stores that fault (a division by an input, both conversions),
+# stores overwritten before they are read, and code no branch reaches
+DEAD_STORES = [
+    ("a, b, x: int; f, g: float;\n{ input(a); input(b); input(f);\n"
+     " x = a / b; x = cast<int>(f); g = cast<float>(a); g = f / b; output(a); }\n",
+     ["1 2 1.5", "1 0 1.5", "1 2 inf", "1 2 nan", "1 2 -0.0"]),
+    ("a, i, n, x: int; g: float;\n{ input(a); input(n); i = 0; while (i < n) { a = a * a; i = i + 1; }\n"
+     " g = cast<float>(a); output(n); }\n", ["10 3", "10 12", "1 12"]),
+    ("a, x, y: int;\n{ input(a); x = a * 2; y = x + 1; x = y * 3; y = 0;\n"
+     " while (a > 0) { x = a; y = y + x; a = a - 1; }\n output(y); }\n", ["0", "4"]),
+    ("a, x: int;\n{ input(a); x = 0;\n"
+     " while (1 < 2) { switch (a) { case 1: x = x + 1; break; default: x = x + 2; break; } a = a - 1;\n"
+     " if (a < 0) { output(x); x = x / 0; } else x = x + 1; }\n output(x); }\n", ["3", "0"]),
+]
+
+
+@pytest.mark.parametrize('text, inputs', DEAD_STORES)
+def test_dead_stores(text, inputs):
+    assert_same_runs(text, inputs)
+
+
+# hoist_invariants: loops that run zero times with invariants that fault, invariants read
+# after the loop, operands the loop redefines, and nested loops, also inside a switch
+LOOPS = [
+    ("a, d, i, n, x, y: int; f, g: float;\n{ input(a); input(d); input(f); input(n); x = 5; i = 0;\n"
+     " while (i < n) { x = a / d; y = cast<int>(f); g = cast<float>(a); g = g * f; i = i + 1; }\n"
+     " output(x); output(y); output(g); }\n",
+     ["7 0 inf 0", "7 0 inf 1", "7 2 nan 1", "7 2 1.5 0", "7 2 1.5 3", "-7 2 -2.5 2"]),
+    ("a, b, i, n, x, y: int;\n{ input(a); input(b); input(n); i = 0; y = 0;\n"
+     " while (i < n) { x = a + b; y = y + x; b = b + 1; x = a * 2; i = i + 1; }\n output(x); output(y); }\n",
+     ["1 1 0", "1 1 1", "1 1 5"]),
+    ("a, b, i, j, n, x, y: int;\n{ input(a); input(b); input(n); i = 0; y = 0;\n"
+     " while (i < n) { j = 0; while (j < i) { x = a * b; y = y + x; j = j + 1; } a = a + 1; i = i + 1; }\n"
+     " output(x); output(y); }\n", ["2 3 0", "2 3 1", "2 3 2", "2 3 5"]),
+    ("a, i, j, n, x: int; f: float;\n{ input(a); input(f); input(n);\n"
+     " switch (a) { case 1: i = 0; while (i < n) { j = n; while (j > 0) { x = cast<int>(f); j = j - 1; } i = i + 1; }\n"
+     " break; default: x = a; break; }\n output(x); }\n", ["1 inf 0", "1 inf 2", "1 2.5 2", "2 inf 2"]),
+]
+
+
+@pytest.mark.parametrize('text, inputs', LOOPS)
+def test_loops(text, inputs):
+    assert_same_runs(text, inputs)
+
+
+# number_values: repeated expressions, in both operand orders, with an operand redefined or
+# copied in between, int and real operations on the same operands, and repeated faults
+VALUES = [
+    ("a, b, c, x, y, z: int;\n{ input(a); input(b);\n"
+     " x = a + b; y = b + a; z = a * b - b * a; a = a + 1; c = a + b; x = x + y + z + c; output(x);\n"
+     " c = a; y = c * b; z = a * b; output(y); output(z); }\n", ["1 2", "-3 5"]),
+    ("a, b, x: int; f, g, h: float;\n{ input(a); input(b); input(f);\n"
+     " g = a + f; h = f + a; x = a / b; g = g - h; output(g); output(x); x = a / b; output(x);\n"
+     " g = a / b; h = a / b; output(g); output(h); }\n", ["7 2 1.5", "7 0 1.5", "7 2 nan", "-7 2 inf"]),
+    ("a, b, x, y: int; f: float;\n{ input(a); input(f); x = cast<int>(f); b = cast<int>(f); output(a);\n"
+     " y = x + b; f = a; y = y + cast<int>(f); output(y); }\n", ["3 2.5", "3 inf", "3 nan"]),
+]
+
+
+@pytest.mark.parametrize('text, inputs', VALUES)
+def test_values(text, inputs):
+    assert_same_runs(text, inputs)
@@ -0,0 +1,32 @@
+""" ParserCPQ builds its tables through private steps of sly 0.5, without them sly builds the parser """
+import os
+import subprocess
+import sys
+from parser_cpq import ParserCPQ
+from session import CompileSession
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+SOURCE = "a, b: int;\n{ input(a); b = a * 2; if (a > b || !(a == 0)) output(b); else output(a); }\n"
+
+# hides the build steps from hasattr (sly itself still has them) and compiles SOURCE
+WITHOUT_STEPS = f"""
+import builtins
+has = builtins.hasattr
+builtins.hasattr = lambda obj, name: not name.startswith('_Parser__') and has(obj, name)
+import parser_cpq
+builtins.hasattr = has
+from session import CompileSession
+assert '_build' not in vars(parser_cpq.ParserCPQ)
+print(CompileSession().compile({SOURCE!r}).lines())
+"""
+
+
+def test_cached_build_is_used():
+    assert '_build' in vars(ParserCPQ)
+
+
+def test_build_without_sly_steps(tmp_path):
+    environment = dict(os.environ, PYTHONPATH=os.path.join(TESTS_DIR, os.pardir, 'src'), CPQ_CACHE_DIR=str(tmp_path))
+    output = subprocess.run([sys.executable, '-c', WITHOUT_STEPS], capture_output=True, text=True, check=True,
+                            env=environment).stdout
+    assert output.strip() == str(CompileSession().compile(SOURCE).lines())
@@ -0,0 +1,88 @@
+""" AotProgram has to print what QuadVM prints and stop with the same QuadError """
+from io import StringIO
+import pytest
+from cpl_generator import ProgramGenerator
+from quadaot import AotProgram
+from quadvm import QuadError, QuadProgram, QuadVM
+from session import CompileSession
+
+INPUTS = ["3 4 5 1 2 " * 20, "0 " * 40, "7 -2 0 9 1.5 " * 8]
+
+# faults in the middle of a loop, after some output, in int and in float code, with an input that faults
+FAULTS = [
+    ("a, b, c: int;\n{\n input(a); input(b);\n while (a > 0) {\n output(a);\n a = a - 1;\n c = 100 / (a - b);\n"
+     " output(c);\n }\n}\n", "3 1"),
+    ("x, y, z: float;\n{\n input(x); input(y);\n while (x < 10) {\n x = x + 1;\n z = x / y;\n output(z);\n"
+     " y = y - 1;\n }\n}\n", "7 1"),
+    ("a: int; f: float;\n{\n input(a); input(f);\n switch (a) {\n case 1: a = a / 0; break;\n"
+     " default: f = f / a; break;\n }\n output(a);\n output(f);\n}\n", "1 2"),
+]
+
+
+@pytest.fixture(autouse=True)
+def no_aot_cache(monkeypatch):
+    monkeypatch.setenv('CPQ_NO_AOT_CACHE', '1')
+
+
+def compile_program(text):
+    result = CompileSession().compile(text)
+    assert result.ok, result.diagnostics
+    return QuadProgram.decode(result.lines())
+
+
+def run(make_runner, program, text):
+    out = StringIO()
+    try:
+        make_runner(StringIO(text), out).run(program)
+    except QuadError as error:
+        return out.getvalue(), str(error)
+    return out.getvalue(), None
+
+
+class AotRunner:
+    def __init__(self, stdin, stdout):
+        self.stdin, self.stdout = stdin, stdout
+
+    def run(self, program):
+        return AotProgram.build(program).run(self.stdin, self.stdout)
+
+
+def assert_same_runs(program):
+    for text in INPUTS:
+        assert run(AotRunner, program, text) == run(QuadVM, program, text)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_generated_programs(seed):
+    text = ProgramGenerator(seed, declarations=8, depth=3).program(statements=25)
+    assert_same_runs(compile_program(text))
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_generated_programs_that_divide_by_an_input(seed):
+    # the generator only divides by literals, the division by a variable can fault
+    text = ProgramGenerator(seed, declarations=8, depth=3).program(statements=15)
+    text = text[:text.rindex("}")] + "    i0 = i1 / i2;\n    f0 = f0 / i3;\n    output(i0);\n    output(f0);\n}\n"
+    assert_same_runs(compile_program(text))
+
+
+@pytest.mark.parametrize('text, faulting_input', FAULTS)
+def test_division_by_zero(text, faulting_input):
+    program = compile_program(text)
+    assert_same_runs(program)
+    output, error = run(QuadVM, program, faulting_input)
+    assert error is not None and 'division by zero' in error
+    assert run(AotRunner, program, faulting_input) == (output, error)
+
+
+def test_float_names_are_variables():
+    # inf, nan, Infinity and NaN are variables that start at 0 like any other
+    program = QuadProgram.decode(["IINP inf", "IADD nan inf Infinity", "RASN NaN 1.5", "IPRT nan", "RPRT NaN", "HALT"])
+    assert set(program.symbols) == {'inf', 'nan', 'Infinity', 'NaN'}
+    vm = QuadVM(StringIO("4"), StringIO())
+    vm.run(program)
+    assert vm.variables(program) == {'inf': 4, 'nan': 4, 'Infinity': 0, 'NaN': 1.5}
+    assert run(AotRunner, program, "4") == run(QuadVM, program, "4") == ("4\n1.5\n", None)
+    aot = AotProgram.build(program)
+    aot.run(StringIO("4"), StringIO())
+    assert aot.variables() == vm.variables(program)
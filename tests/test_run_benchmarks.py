@@ -0,0 +1,23 @@
+""" the benchmarks time every optimizer pass as a phase of its own """
+from cpl_generator import ProgramGenerator
+from optimizer import Optimizer
+from run_benchmarks import PHASES, RESULTS_VERSION, compare, run_once
+
+
+def test_every_pass_is_a_phase(tmp_path):
+    text = ProgramGenerator(0).program(lines=200)
+    times, counts = run_once(text, str(tmp_path), 'fast')
+    assert list(times) == list(PHASES)
+    assert set(Optimizer.PASSES) <= set(times)
+    assert counts['optimized_quads'] <= counts['quads']
+
+
+def test_compare_reports_every_pass(capsys):
+    seconds = {phase: 1.0 for phase in PHASES}
+    results = {'version': RESULTS_VERSION, 'generator': {}, 'sizes': [{'lines': 10, 'seconds': seconds, 'total': len(PHASES)}]}
+    slower = dict(seconds, reuse_temps=2.0)
+    current = {'version': RESULTS_VERSION, 'generator': {}, 'sizes': [{'lines': 10, 'seconds': slower, 'total': len(PHASES) + 1}]}
+    assert compare(current, results, 1.25) == 1
+    lines = capsys.readouterr().out.splitlines()
+    assert [line.split()[2] for line in lines] == list(PHASES) + ['total']
+    assert [line.split()[2] for line in lines if line.endswith('SLOWER')] == ['reuse_temps']
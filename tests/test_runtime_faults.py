@@ -0,0 +1,64 @@
+""" a fault of an instruction stops QuadVM, QuadProfiler and AotProgram with the same QuadError,
+    naming the quad line of the instruction """
+from io import StringIO
+import pytest
+from quadaot import AotProgram
+from quadprof import QuadProfiler
+from quadvm import QuadError, QuadProgram, QuadVM
+from session import CompileSession
+
+# f and i are squared until f is infinite and i has thousands of digits
+GROW = "{\n input(f); input(i);\n n = 0;\n while (n < 12) {\n f = f * f;\n i = i * i;\n n = n + 1;\n }\n"
+DECLARATIONS = "f, g: float; i, j, n: int;\n"
+
+FAULTS = [
+    (DECLARATIONS + GROW + " j = cast<int>(f);\n output(j);\n}\n", "cannot convert float infinity to integer"),
+    (DECLARATIONS + GROW + " g = f - f;\n j = cast<int>(g);\n output(j);\n}\n", "cannot convert float NaN to integer"),
+    (DECLARATIONS + GROW + " g = cast<float>(i);\n output(g);\n}\n", "int too large to convert to float"),
+    (DECLARATIONS + GROW + " j = i / 0;\n output(j);\n}\n", "division by zero"),
+]
+
+
+def run_aot(program, stdin, stdout):
+    AotProgram.build(program).run(stdin, stdout)
+
+
+ENGINES = {
+    'vm': lambda program, stdin, stdout: QuadVM(stdin, stdout).run(program),
+    'profiler': lambda program, stdin, stdout: QuadProfiler(stdin, stdout).run(program),
+    'aot': run_aot,
+}
+
+
+@pytest.fixture(autouse=True)
+def no_aot_cache(monkeypatch):
+    monkeypatch.setenv('CPQ_NO_AOT_CACHE', '1')
+
+
+@pytest.mark.parametrize('text, message', FAULTS)
+def test_faults_are_quad_errors(text, message):
+    result = CompileSession().compile(text)
+    assert result.ok, result.diagnostics
+    program = QuadProgram.decode(result.lines())
+    errors = {}
+    for name, run in ENGINES.items():
+        with pytest.raises(QuadError) as error:
+            run(program, StringIO("10 10"), StringIO())
+        errors[name] = str(error.value)
+    assert errors['vm'].startswith("line ") and errors['vm'].endswith(f": {message}")
+    assert errors['profiler'] == errors['vm']
+    assert errors['aot'] == errors['vm']
+
+
+@pytest.mark.parametrize('stdin, message', [("10", "input exhausted"), ("10 ten", "illegal input value 'ten'")])
+def test_input_faults_name_the_line(stdin, message):
+    result = CompileSession().compile(DECLARATIONS + GROW + " output(i);\n}\n")
+    assert result.ok, result.diagnostics
+    program = QuadProgram.decode(result.lines())
+    errors = {}
+    for name, run in ENGINES.items():
+        with pytest.raises(QuadError) as error:
+            run(program, StringIO(stdin), StringIO())
+        errors[name] = str(error.value)
+    assert errors['vm'] == f"line 2: {message}"
+    assert errors['profiler'] == errors['aot'] == errors['vm']